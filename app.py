@@ -5,7 +5,12 @@ from bokeh.resources import CDN
 import importlib
 import os
 import sys
-from utils.database import query_cache
+from utils.database import (query_cache, start_background_refresh, get_latest_flights, get_all_flights, get_trails,
+                            fetch_snapshot_range, get_snapshot_extent, restore_snapshot_cache, config)
+from utils.push import SnapshotBroadcaster, SnapshotPublisher, FakeSnapshotSource, register_push_routes
+from utils.tiles import DensityTileService, register_tile_routes
+from utils.trajectories import register_trail_routes
+from utils.replay import ReplayService, register_replay_routes
 from datetime import datetime
 
 
@@ -166,5 +171,57 @@ app.clientside_callback(
     Input("url", "pathname")
 )
 
+# Server-Sent Events channel for the live map (/stream/planes)
+plane_publisher = None
+if config.get("live_push", False):
+    plane_broadcaster = SnapshotBroadcaster()
+    register_push_routes(app.server, plane_broadcaster)
+    fake_planes = config.get("live_push_fake_planes", 0)
+    plane_publisher = SnapshotPublisher(
+        plane_broadcaster,
+        FakeSnapshotSource(planes=fake_planes) if fake_planes else get_latest_flights,
+        poll_seconds=config.get("live_push_poll_seconds", 1),
+        filter_minutes=config.get("filter_old_planes_minutes", 2)
+    )
+
+# Aircraft density map tiles (/tiles/density/{z}/{x}/{y}.png)
+density_tiles = DensityTileService(
+    lambda: get_all_flights(columns=['longitude', 'latitude']),
+    max_zoom=config.get("density_tiles_max_zoom", 12),
+    cache_tiles=config.get("density_tiles_cache", 2048)
+)
+register_tile_routes(app.server, density_tiles)
+
+# Recent positions of the requested aircraft for flight trails (/api/trails)
+register_trail_routes(app.server, get_trails)
+
+# Windows of past opensky_raw snapshots for replay on the live map (/api/replay/...)
+if config.get("replay", True):
+    register_replay_routes(app.server, ReplayService(
+        fetch_snapshot_range,
+        get_snapshot_extent,
+        window_seconds=config.get("replay_window_seconds", 300),
+        cache_windows=config.get("replay_cache_windows", 6),
+        filter_minutes=config.get("filter_old_planes_minutes", 2)
+    ))
+
+def start_background_threads():
+    """Start the threads that keep the cache warm and push live snapshots."""
+    # Serve the tables saved by the previous run until their first refresh
+    restore_snapshot_cache()
+    # Keep hot tables warm so callbacks are served from memory
+    start_background_refresh()
+    if plane_publisher is not None:
+        plane_publisher.start()
+
+DEBUG = True
+
+# With the debug reloader, `python app.py` runs this module in a watcher process
+# that only restarts the server, and again in the serving child with
+# WERKZEUG_RUN_MAIN set. Only the serving process starts the threads; an import
+# by another server (e.g. gunicorn app:server) starts them right away.
+if __name__ != '__main__' or not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    start_background_threads()
+
 if __name__ == '__main__':
-    app.run_server(debug=True) 
\ No newline at end of file
+    app.run_server(debug=DEBUG) 
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Compare the former row-wise flight phase classification with
+utils.flight_phase.classify_flight_phase.
+
+Run from the project root:
+
+    python -m benchmarks.flight_phase
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.flight_phase import classify_flight_phase
+
+
+def make_snapshot(n, seed=0):
+    rng = np.random.default_rng(seed)
+    vertical_rate = rng.normal(0, 5, n)
+    vertical_rate[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        'on_ground': rng.random(n) < 0.1,
+        'vertical_rate': vertical_rate
+    })
+
+
+def classify_rowwise(df):
+    """The per-row implementation previously used by pages/statistics.py."""
+    def categorize_phase(row):
+        if row['on_ground'] == True:
+            return 'On Ground'
+        if 'vertical_rate' in df.columns and 'vertical_rate' in row and not pd.isna(row['vertical_rate']):
+            vrate = row['vertical_rate']
+            if vrate > 2.5:
+                return 'Ascending'
+            elif vrate < -2.5:
+                return 'Descending'
+        return 'Cruising'
+    return df.apply(categorize_phase, axis=1)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'rows':>10} {'row-wise s':>12} {'vectorized s':>14} {'speedup':>10}")
+    for n in (10_000, 100_000, 1_000_000):
+        df = make_snapshot(n)
+        expected, rowwise = timed(lambda: classify_rowwise(df))
+        result, vectorized = timed(lambda: classify_flight_phase(df))
+        assert (expected == result).all()
+        print(f"{n:>10} {rowwise:>12.3f} {vectorized:>14.4f} {rowwise / vectorized:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
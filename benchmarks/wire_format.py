@@ -0,0 +1,63 @@
+"""
+Compare the JSON plane payload with the binary utils.wire table.
+
+Run from the project root:
+
+    python -m benchmarks.wire_format
+"""
+import gzip
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.live_feed import project_planes, _records
+from utils.wire import encode_planes, encode_planes_base64, decode_planes
+
+
+def make_snapshot(n, seed=0):
+    rng = np.random.default_rng(seed)
+    countries = ["Germany", "France", "United States", "United Kingdom", "Spain", "Italy", "China", "Brazil"]
+    return pd.DataFrame({
+        'icao24': [f"{i:06x}" for i in range(n)],
+        'callsign': [f"ABC{i % 9000:04d}" for i in range(n)],
+        'origin_country': rng.choice(countries, n),
+        'longitude': rng.uniform(-180, 180, n),
+        'latitude': rng.uniform(-60, 70, n),
+        'velocity': rng.uniform(0, 300, n),
+        'true_track': rng.uniform(0, 360, n),
+        'time_position': pd.Timestamp.now(tz='UTC') - pd.to_timedelta(rng.uniform(0, 60, n), unit='s')
+    })
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def main():
+    print(f"{'planes':>8} {'format':>8} {'bytes':>10} {'gzip':>10} {'encode ms':>10} {'decode ms':>10}")
+    for n in (1000, 10000, 20000):
+        planes = project_planes(make_snapshot(n))
+
+        text, encode_ms = timed(lambda: json.dumps(_records(planes)))
+        _, decode_ms = timed(lambda: json.loads(text))
+        payload = text.encode()
+        print(f"{n:>8} {'json':>8} {len(payload):>10} {len(gzip.compress(payload)):>10} {encode_ms:>10.1f} {decode_ms:>10.1f}")
+
+        data, encode_ms = timed(lambda: encode_planes(planes))
+        _, decode_ms = timed(lambda: decode_planes(data))
+        print(f"{n:>8} {'bin':>8} {len(data):>10} {len(gzip.compress(data)):>10} {encode_ms:>10.1f} {decode_ms:>10.1f}")
+
+        text, encode_ms = timed(lambda: encode_planes_base64(planes))
+        payload = text.encode()
+        print(f"{n:>8} {'bin+b64':>8} {len(payload):>10} {len(gzip.compress(payload)):>10} {encode_ms:>10.1f} {'':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,7 +30,7 @@ def get_heatmap_data():
     """Fetch and process data for heatmap visualization."""
     try:
         # Get flight data from the database
-        df = get_all_flights()
+        df = get_all_flights(columns=['longitude', 'latitude'])
         
         if df is None or df.empty or 'longitude' not in df.columns or 'latitude' not in df.columns:
             # Generate dummy data if no real data available
@@ -102,11 +102,11 @@ def layout():
 )
 def update_heatmap(palette_name, n_clicks):
     """Update the heatmap with the selected color palette."""
-    # Get heatmap data
-    data = get_heatmap_data()
+    # Get the density grid; unchanged snapshots reuse the cached histogram
+    density = get_heatmap_density()
     
     # Create the Bokeh figure
-    p = create_heatmap_figure(data, palette_name)
+    p = create_heatmap_figure(density, palette_name)
     
     # Convert the Bokeh figure to JSON for embedding
     p_json = json.dumps(json_item(p))
@@ -122,13 +122,56 @@ def update_heatmap(palette_name, n_clicks):
         """)
     ])
 
-def create_heatmap_figure(data, palette_name='Viridis'):
-    """Create a Bokeh heatmap figure."""
-    # Get data as numpy arrays
-    x = data['longitude']
-    y = data['latitude']
-    
-    if len(x) == 0 or len(y) == 0:
+# Density grid of the last snapshot, so palette changes only re-colour it
+_density_cache = {"source": None, "density": None}
+
+def compute_density(x, y, bin_size=0.5, max_bins=1000):
+    """
+    Bin positions into a 2D histogram covering the extent of the data.
+    Returns the grid as an image array (rows are latitude) with its extent,
+    or None when there are no valid positions.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y) & (np.abs(x) <= 180) & (np.abs(y) <= 90)
+    x = x[valid]
+    y = y[valid]
+    if len(x) == 0:
+        return None
+
+    # Data-driven extent, padded by one bin on each side
+    x_min, x_max = x.min() - bin_size, x.max() + bin_size
+    y_min, y_max = y.min() - bin_size, y.max() + bin_size
+    nx = int(min(max_bins, np.ceil((x_max - x_min) / bin_size)))
+    ny = int(min(max_bins, np.ceil((y_max - y_min) / bin_size)))
+
+    h, _, _ = np.histogram2d(x, y, bins=[nx, ny], range=[[x_min, x_max], [y_min, y_max]])
+    # Empty bins become NaN so they are drawn transparent
+    image = np.where(h > 0, h, np.nan).T
+    return {
+        'image': image,
+        'x': x_min,
+        'y': y_min,
+        'dw': x_max - x_min,
+        'dh': y_max - y_min,
+        'max': float(h.max())
+    }
+
+def get_heatmap_density():
+    """Return the density grid for the current snapshot, computed once per snapshot."""
+    df = get_all_flights(columns=['longitude', 'latitude'])
+    if df is not None and not df.empty and _density_cache["source"] is df:
+        return _density_cache["density"]
+    data = get_heatmap_data()
+    density = compute_density(data['longitude'], data['latitude'])
+    if df is not None and not df.empty:
+        _density_cache["source"] = df
+        _density_cache["density"] = density
+    return density
+
+def create_heatmap_figure(density, palette_name='Viridis'):
+    """Create a Bokeh heatmap figure from a density grid."""
+    if density is None:
         # Return an empty figure with a message if no data
         p = figure(
             title="No data available for heatmap",
@@ -140,12 +183,6 @@ def create_heatmap_figure(data, palette_name='Viridis'):
         p.text(0, 0, ["No flight data available"], text_font_size='20pt', text_align='center')
         return p
     
-    # Create a 2D histogram
-    h, x_edges, y_edges = np.histogram2d(
-        x, y, 
-        bins=[np.linspace(-15, 35, 100), np.linspace(30, 65, 100)]
-    )
-    
     # Create the figure with appropriate map tiles
     p = figure(
         title="Aircraft Density Heatmap",
@@ -155,8 +192,8 @@ def create_heatmap_figure(data, palette_name='Viridis'):
         tools="pan,wheel_zoom,box_zoom,reset,save",
         x_axis_label="Longitude",
         y_axis_label="Latitude",
-        x_range=(-15, 35),
-        y_range=(30, 65),
+        x_range=(density['x'], density['x'] + density['dw']),
+        y_range=(density['y'], density['y'] + density['dh']),
         match_aspect=True
     )
     
@@ -166,41 +203,20 @@ def create_heatmap_figure(data, palette_name='Viridis'):
     # Get the selected color palette
     palette = color_palettes.get(palette_name, Viridis256)
     
-    # Normalize and rescale the histogram data for better visualization
-    h_norm = h / np.max(h) if np.max(h) > 0 else h
-    
-    # Create rectangles for the heatmap with alpha based on value
-    dx = (x_edges[1] - x_edges[0])
-    dy = (y_edges[1] - y_edges[0])
-    
-    # Create data source for rectangles
-    source_data = {
-        'x': [], 'y': [], 'width': [], 'height': [], 'value': []
-    }
-    
-    for i in range(len(x_edges)-1):
-        for j in range(len(y_edges)-1):
-            if h[i, j] > 0:  # Only add rectangles where there is data
-                source_data['x'].append(x_edges[i])
-                source_data['y'].append(y_edges[j])
-                source_data['width'].append(dx)
-                source_data['height'].append(dy)
-                source_data['value'].append(h[i, j])
-    
-    # Create color mapper
+    # Create color mapper; empty bins are NaN and stay transparent
     color_mapper = LinearColorMapper(
         palette=palette, 
         low=0, 
-        high=np.max(source_data['value']) if source_data['value'] else 1
+        high=density['max'] if density['max'] > 0 else 1,
+        nan_color=(0, 0, 0, 0)
     )
     
-    # Add rectangles to the figure
-    p.rect(
-        x='x', y='y', width='width', height='height',
-        source=source_data,
-        fill_color={'field': 'value', 'transform': color_mapper},
-        line_color=None,
-        alpha=0.7
+    # The whole density raster is a single image glyph
+    p.image(
+        image=[density['image']],
+        x=density['x'], y=density['y'], dw=density['dw'], dh=density['dh'],
+        color_mapper=color_mapper,
+        global_alpha=0.7
     )
     
     # Add color bar
@@ -219,10 +235,10 @@ def create_heatmap_figure(data, palette_name='Viridis'):
         tooltips=[
             ("Longitude", "$x{0.00}"),
             ("Latitude", "$y{0.00}"),
-            ("Count", "@value")
+            ("Count", "@image")
         ],
         point_policy="follow_mouse"
     )
     p.add_tools(hover)
     
-    return p 
\ No newline at end of file
+    return p
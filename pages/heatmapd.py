@@ -1,23 +1,33 @@
 import dash
-from dash import html, dcc, callback, Input, Output, State
+from dash import html, dcc, callback, clientside_callback, Input, Output, State
 import dash_bootstrap_components as dbc
 import pandas as pd
 import numpy as np
 import traceback
 import json
+import threading
+import time
 import dash_deck
 import pydeck as pdk
-from utils.database import query_cache, get_all_flights
+from utils.database import query_cache, get_all_flights, add_cache_listener, cache_key, config
+from utils.datasets import DatasetRegistry
+from utils.hexbins import aggregate_h3, resolution_for_radius, HEATMAP_RESOLUTION, H3_EDGE_METERS
 
 # Register the page
 dash.register_page(__name__, path="/heatmapd")
 
+# Point sets stay on the server; the heatmap-data store only holds a handle
+datasets = DatasetRegistry(
+    ttl_seconds=config.get("dataset_ttl_seconds", 600),
+    max_entries=config.get("dataset_max_entries", 32)
+)
+
 def get_heatmap_data():
     """Fetch and process data for the heatmap from the data cache."""
     try:
         # Get flight data from the cache
         print("HeatmapD: Getting data from cache")
-        df = get_all_flights()
+        df = get_all_flights(columns=['longitude', 'latitude'])
         
         # Print debug info
         print(f"HeatmapD: Retrieved {len(df) if df is not None else 0} rows")
@@ -49,35 +59,7 @@ def get_heatmap_data():
                 'weight': weights
             })
         
-        # Process dataframe to extract latitude, longitude, and assign weights
-        # Keep only valid coordinates and remove any NaN values
-        points_df = df[['latitude', 'longitude']].copy()
-        points_df = points_df.dropna(subset=['latitude', 'longitude'])
-        
-        # Filter out any invalid coordinates (sometimes data can have extreme values)
-        points_df = points_df[
-            (points_df['latitude'] >= -90) & (points_df['latitude'] <= 90) &
-            (points_df['longitude'] >= -180) & (points_df['longitude'] <= 180)
-        ]
-        
-        print(f"HeatmapD: After filtering, processed data shape: {points_df.shape}")
-        
-        # Add weight column (all points have equal weight by default)
-        if 'weight' not in points_df.columns:
-            points_df['weight'] = 1.0
-        
-        # Rename columns for deck.gl
-        points_df = points_df.rename(columns={
-            'latitude': 'lat',
-            'longitude': 'lng'
-        })
-        
-        # Sample data if too large (deck.gl can struggle with too many points)
-        if len(points_df) > 1000000:
-            print(f"HeatmapD: Sampling data from {len(points_df)} to 500000 points")
-            points_df = points_df.sample(500000, random_state=42)
-        
-        return points_df
+        return build_heatmap_points(df)
     except Exception as e:
         print(f"[HeatmapD] Error in get_heatmap_data: {str(e)}")
         print(traceback.format_exc())
@@ -91,6 +73,100 @@ def get_heatmap_data():
             'weight': np.ones(100)
         })
 
+def build_heatmap_points(df):
+    """Turn a flights DataFrame into the lat/lng/weight points used by the layers."""
+    # Process dataframe to extract latitude, longitude, and assign weights
+    # Keep only valid coordinates and remove any NaN values
+    points_df = df[['latitude', 'longitude']].copy()
+    points_df = points_df.dropna(subset=['latitude', 'longitude'])
+    
+    # Filter out any invalid coordinates (sometimes data can have extreme values)
+    points_df = points_df[
+        (points_df['latitude'] >= -90) & (points_df['latitude'] <= 90) &
+        (points_df['longitude'] >= -180) & (points_df['longitude'] <= 180)
+    ]
+    
+    print(f"HeatmapD: After filtering, processed data shape: {points_df.shape}")
+    
+    # Add weight column (all points have equal weight by default)
+    if 'weight' not in points_df.columns:
+        points_df['weight'] = 1.0
+    
+    # Rename columns for deck.gl
+    points_df = points_df.rename(columns={
+        'latitude': 'lat',
+        'longitude': 'lng'
+    })
+
+    # Every point is kept; only the H3 cells reach deck.gl
+    return points_df
+
+def get_heatmap_handle():
+    """Register the current snapshot's points and return the handle for the heatmap-data store."""
+    try:
+        df = get_all_flights(columns=['longitude', 'latitude'])
+        if df is not None and len(df) > 0 and 'longitude' in df.columns and 'latitude' in df.columns:
+            # The cached snapshot is the same object until it is reloaded, so points are built once per snapshot
+            return datasets.register("heatmapd-points", df, build_heatmap_points)
+    except Exception as e:
+        print(f"[HeatmapD] Error in get_heatmap_handle: {str(e)}")
+    # Dummy data is registered as a snapshot of its own
+    return datasets.register("heatmapd-points", get_heatmap_data())
+
+def build_h3_cells(points, resolution):
+    """The H3 cells of points with only the columns the deck.gl layers read."""
+    return aggregate_h3(points, resolution)[['lat', 'lng', 'weight']]
+
+def get_h3_cells(points, resolution):
+    """Aggregate points into H3 cells once per snapshot and resolution."""
+    with _precompute_ready:
+        _resolutions_used[resolution] = time.monotonic()
+    return _cells(points, resolution)
+
+def _cells(points, resolution):
+    # The registry keys cells by the points object, which stays the same until the snapshot is reloaded
+    return datasets.resolve(datasets.register("heatmapd-cells", points, build_h3_cells, resolution=resolution))
+
+# New snapshots of the heatmap points are binned by a background thread at the
+# resolutions in use, so callbacks find the cells already built
+HEATMAP_POINTS_KEY = cache_key("all_flights", ['longitude', 'latitude'])
+_precompute_ready = threading.Condition()
+_precompute = {"pending": None, "thread": None}
+_resolutions_used = {}   # resolution -> monotonic time of its last use
+
+def _precompute_cells():
+    while True:
+        with _precompute_ready:
+            while _precompute["pending"] is None:
+                _precompute_ready.wait()
+            df = _precompute["pending"]
+            _precompute["pending"] = None
+            recent = time.monotonic() - datasets.ttl_seconds
+            # The layout's defaults, and whatever the hexagon radius was set to lately
+            resolutions = sorted({HEATMAP_RESOLUTION, resolution_for_radius(3000)}
+                                 | {r for r, used in _resolutions_used.items() if used >= recent})
+        try:
+            start = time.monotonic()
+            points = datasets.resolve(datasets.register("heatmapd-points", df, build_heatmap_points))
+            for resolution in resolutions:
+                _cells(points, resolution)
+            print(f"[HeatmapD] Precomputed H3 cells at resolutions {resolutions} "
+                  f"in {(time.monotonic() - start) * 1000:.0f} ms")
+        except Exception as e:
+            print(f"[HeatmapD] Precomputing H3 cells failed: {str(e)}")
+
+def _on_flights_loaded(key, data):
+    if key != HEATMAP_POINTS_KEY or data is None or len(data) == 0 or 'longitude' not in data.columns or 'latitude' not in data.columns:
+        return
+    with _precompute_ready:
+        _precompute["pending"] = data
+        if _precompute["thread"] is None:
+            _precompute["thread"] = threading.Thread(target=_precompute_cells, daemon=True, name="heatmapd-cells")
+            _precompute["thread"].start()
+        _precompute_ready.notify()
+
+add_cache_listener(_on_flights_loaded)
+
 def create_hexagon_layer(data, intensity=1.0, radius=3000, elevation_scale=20, coverage=0.8, upper_percentile=100, color_range=None):
     """Create a hexagon layer for deck.gl."""
     if color_range is None:
@@ -110,6 +186,11 @@ def create_hexagon_layer(data, intensity=1.0, radius=3000, elevation_scale=20, c
         radius=radius,
         elevation_scale=elevation_scale,
         elevation_range=[0, 1000],
+        # Points are H3 cell centroids; sum their weights (aircraft counts)
+        get_elevation_weight='weight',
+        elevation_aggregation='SUM',
+        get_color_weight='weight',
+        color_aggregation='SUM',
         pickable=True,
         extruded=True,
         opacity=intensity,
@@ -186,11 +267,10 @@ def create_deck_map(
         
         print(f"HeatmapD: Map center at {center_lat}, {center_lng}")
         
-        # Limit data size for better performance
-        max_points = 10000
-        if len(data) > max_points:
-            print(f"HeatmapD: Limiting data from {len(data)} to {max_points} points for performance")
-            data = data.sample(max_points, random_state=42)
+        # Aggregate into H3 cells so every aircraft is counted without sending raw points
+        resolution = HEATMAP_RESOLUTION if layer_type == "heatmap" else resolution_for_radius(radius)
+        data = get_h3_cells(data, resolution)
+        print(f"HeatmapD: Aggregated into {len(data)} H3 cells at resolution {resolution}")
             
         if layer_type == "heatmap":
             layer = create_heatmap_layer(
@@ -289,7 +369,8 @@ def create_deck_map(
 def layout():
     # Get heatmap data
     print("HeatmapD: Generating layout")
-    heatmap_data = get_heatmap_data()
+    heatmap_handle = get_heatmap_handle()
+    heatmap_data = datasets.resolve(heatmap_handle)
     print(f"HeatmapD: Got data with shape {heatmap_data.shape}")
     
     # Create deck.gl map
@@ -303,13 +384,6 @@ def layout():
                           style={"height": "600px", "display": "flex", "justifyContent": "center", 
                                  "alignItems": "center", "color": "red", "border": "1px solid red"})
     
-    # Store JSON data
-    try:
-        heatmap_data_json = heatmap_data.to_json(orient='records')
-    except Exception as e:
-        print(f"HeatmapD Error converting data to JSON: {str(e)}")
-        heatmap_data_json = "[]"  # Empty JSON array as fallback
-    
     return html.Div([
         html.H1("Aircraft Density Heatmaps", className="text-center mb-2"),
         
@@ -467,8 +541,10 @@ def layout():
             ], width=9)
         ]),
         
-        # Store the data
-        dcc.Store(id='heatmap-data', data=heatmap_data_json),
+        # Store the handle of the server-side point set
+        dcc.Store(id='heatmap-data', data=heatmap_handle),
+        # H3 resolution of the hexagon radius; the map data is only rebuilt when it changes
+        dcc.Store(id='hexagon-resolution', data=resolution_for_radius(3000)),
         
         # Load notification
         dcc.Loading(
@@ -493,24 +569,30 @@ def toggle_layer_settings(layer_type):
 
 @callback(
     [Output('deckgl-map', 'data'),
-     Output('loading-output', 'children')],
+     Output('loading-output', 'children'),
+     Output('heatmap-data', 'data')],
     [Input('layer-type-dropdown', 'value'),
-     Input('intensity-slider', 'value'),
-     # Hexagon layer inputs
-     Input('hexagon-radius-slider', 'value'),
-     Input('hexagon-elevation-slider', 'value'),
-     Input('hexagon-coverage-slider', 'value'),
-     Input('hexagon-percentile-slider', 'value'),
-     # Heatmap layer inputs
-     Input('heatmap-radius-slider', 'value'),
-     Input('heatmap-threshold-slider', 'value'),
+     Input('hexagon-resolution', 'data'),
      # Refresh button
      Input('refresh-btn', 'n_clicks')],
-    [State('heatmap-data', 'data')],
+    # Visual settings are applied in the browser by restyle_deck_layers;
+    # they are only read here when the data is rebuilt
+    [State('intensity-slider', 'value'),
+     # Hexagon layer settings
+     State('hexagon-radius-slider', 'value'),
+     State('hexagon-elevation-slider', 'value'),
+     State('hexagon-coverage-slider', 'value'),
+     State('hexagon-percentile-slider', 'value'),
+     # Heatmap layer settings
+     State('heatmap-radius-slider', 'value'),
+     State('heatmap-threshold-slider', 'value'),
+     State('heatmap-data', 'data')],
     prevent_initial_call=False
 )
 def update_deck_map(
     layer_type,
+    hexagon_resolution,
+    n_clicks,
     intensity,
     hexagon_radius,
     hexagon_elevation,
@@ -518,8 +600,7 @@ def update_deck_map(
     hexagon_percentile,
     heatmap_radius,
     heatmap_threshold,
-    n_clicks,
-    data_json
+    handle
 ):
     """Update the deck.gl map based on selected parameters."""
     try:
@@ -534,23 +615,23 @@ def update_deck_map(
         # Get current data or refresh if refresh button was clicked
         if trigger_id == 'refresh-btn':
             print("HeatmapD: Refreshing data from cache")
-            data = get_heatmap_data()
+            handle = get_heatmap_handle()
+            data = datasets.resolve(handle)
             status = "Data refreshed from cache"
         else:
-            # Parse the JSON back to a DataFrame
-            try:
-                if data_json and data_json != "[]":
-                    data = pd.read_json(data_json, orient='records')
-                    status = f"Using cached data ({len(data)} points)"
-                else:
-                    print("HeatmapD: Empty data in store, fetching new data")
-                    data = get_heatmap_data()
-                    status = "Initial data loaded"
-            except Exception as e:
-                print(f"HeatmapD Error parsing JSON data: {str(e)}")
-                print(traceback.format_exc())
-                data = pd.DataFrame(columns=['lat', 'lng', 'weight'])
-                status = "Error loading data"
+            # Resolve the handle to the server-side point set
+            data = datasets.resolve(handle)
+            if data is not None:
+                status = f"Using cached data ({len(data)} points)"
+            else:
+                # Unknown or expired handle (e.g. after a restart): register the current snapshot again
+                print("HeatmapD: Dataset handle expired, fetching new data")
+                handle = get_heatmap_handle()
+                data = datasets.resolve(handle)
+                status = "Initial data loaded"
+        if data is None:
+            data = pd.DataFrame(columns=['lat', 'lng', 'weight'])
+            status = "Error loading data"
         
         print(f"HeatmapD: Updating map with {len(data)} data points")
         
@@ -573,7 +654,7 @@ def update_deck_map(
             heatmap_threshold=heatmap_threshold
         )
         
-        return deck.data, status
+        return deck.data, status, handle
     except Exception as e:
         print(f"HeatmapD Error updating deck map: {str(e)}")
         print(traceback.format_exc())
@@ -602,10 +683,76 @@ def update_deck_map(
                 tooltip={"html": f"<b>Error:</b> {str(e)[:50]}..."}
             )
             
-            return empty_deck_gl.data, f"Error: {str(e)[:100]}"
+            return empty_deck_gl.data, f"Error: {str(e)[:100]}", dash.no_update
         except:
             # If even the empty map fails
-            return {}, f"Critical error: Unable to create map"
+            return {}, f"Critical error: Unable to create map", dash.no_update
+
+# Map the hexagon radius to its H3 resolution in the browser; the store only
+# changes (and triggers update_deck_map) when the resolution does
+clientside_callback(
+    """
+    function(radius, current) {
+        const edges = %s;
+        let resolution = edges.length - 1;
+        for (let i = 0; i < edges.length; i++) {
+            if (edges[i] <= radius / 2) {
+                resolution = i;
+                break;
+            }
+        }
+        return resolution === current ? window.dash_clientside.no_update : resolution;
+    }
+    """ % json.dumps(H3_EDGE_METERS),
+    Output('hexagon-resolution', 'data'),
+    Input('hexagon-radius-slider', 'value'),
+    State('hexagon-resolution', 'data'),
+    prevent_initial_call=True
+)
+
+# Patch the layer props of the current deck in the browser, so slider drags
+# neither call the server nor resend the data
+clientside_callback(
+    """
+    function(intensity, radius, elevation, coverage, percentile, heatmapRadius, threshold, deck) {
+        if (!deck) {
+            return window.dash_clientside.no_update;
+        }
+        const isString = typeof deck === 'string';
+        const spec = isString ? JSON.parse(deck) : deck;
+        if (!spec.layers) {
+            return window.dash_clientside.no_update;
+        }
+        const layers = spec.layers.map(function(layer) {
+            const patched = Object.assign({}, layer);
+            if (layer['@@type'] === 'HexagonLayer') {
+                patched.opacity = intensity;
+                patched.radius = radius;
+                patched.elevationScale = elevation;
+                patched.coverage = coverage;
+                patched.upperPercentile = percentile;
+            } else if (layer['@@type'] === 'HeatmapLayer') {
+                patched.intensity = intensity;
+                patched.radiusPixels = heatmapRadius;
+                patched.threshold = threshold;
+            }
+            return patched;
+        });
+        const restyled = Object.assign({}, spec, {layers: layers});
+        return isString ? JSON.stringify(restyled) : restyled;
+    }
+    """,
+    Output('deckgl-map', 'data', allow_duplicate=True),
+    [Input('intensity-slider', 'value'),
+     Input('hexagon-radius-slider', 'value'),
+     Input('hexagon-elevation-slider', 'value'),
+     Input('hexagon-coverage-slider', 'value'),
+     Input('hexagon-percentile-slider', 'value'),
+     Input('heatmap-radius-slider', 'value'),
+     Input('heatmap-threshold-slider', 'value')],
+    State('deckgl-map', 'data'),
+    prevent_initial_call=True
+)
 
 @callback(
     Output("debug-info", "style"),
@@ -28,9 +28,13 @@ def layout():
 )
 def update_table(_):
     try:
-        # Get data with automatic caching
+        # Get data with automatic caching, only the rendered columns of planes on ground
         table_name = "last_timestamp"
-        df = query_cache(table_name)
+        df = query_cache(
+            table_name,
+            columns=['callsign', 'icao24', 'origin_country', 'longitude', 'latitude', 'time_position', 'squawk'],
+            filters={'on_ground': True}
+        )
         
         # Filter for on_ground planes
         if 'on_ground' in df.columns:
@@ -5,17 +5,83 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-from utils.database import query_cache
+from utils.database import get_flight_stats, get_fleet_series
 import pycountry
 
 # Register this page
 dash.register_page(__name__, path="/statistics")
 
 def get_stats_data():
-    """Get statistics data from the database with automatic caching"""
-    # Get the last timestamp data (database status)
-    last_timestamp_df = query_cache("last_timestamp")
-    return last_timestamp_df
+    """Get statistics aggregates, computed in the warehouse when possible"""
+    return get_flight_stats()
+
+def create_histogram_figure(histogram, color, title, xaxis_title, unit, mean_format, x_max):
+    """Bar chart for a pre-binned histogram from utils.flight_stats"""
+    edges = histogram['edges']
+    counts = histogram['counts']
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=edges[1] - edges[0],
+        marker_color=color,
+        opacity=0.7
+    ))
+    mean_value = histogram['mean']
+    if mean_value is not None:
+        fig.add_vline(x=mean_value, line_dash='dash', line_color='red')
+        if len(counts) > 0:
+            fig.add_annotation(x=mean_value, y=max(counts),
+                text=f"Mean: {mean_value:{mean_format}} {unit}", showarrow=False, yshift=20, font=dict(color='red'))
+    fig.update_layout(
+        title=dict(text=title, font=dict(size=18), x=0.5),
+        xaxis_title=xaxis_title,
+        yaxis_title='Number of Aircraft',
+        margin=dict(t=60, b=40, l=0, r=0),
+        xaxis=dict(range=[0, x_max]),
+        showlegend=False,
+        bargap=0
+    )
+    return fig
+
+def create_trend_figures(series, countries, status_colors):
+    """Line charts of the rolling fleet window: aircraft per phase, mean altitude and speed, top countries"""
+    phase_fig = go.Figure()
+    for phase, color in status_colors.items():
+        if phase in series.columns:
+            phase_fig.add_trace(go.Scatter(x=series.index, y=series[phase], name=phase,
+                                           mode='lines', stackgroup='phases', line=dict(color=color)))
+    phase_fig.update_layout(
+        title=dict(text='Aircraft by Flight Phase', font=dict(size=18), x=0.5),
+        yaxis_title='Number of Aircraft',
+        margin=dict(t=60, b=40, l=0, r=0),
+        legend=dict(orientation='h', y=-0.15)
+    )
+
+    mean_fig = go.Figure()
+    if 'geo_altitude_mean' in series.columns:
+        mean_fig.add_trace(go.Scatter(x=series.index, y=series['geo_altitude_mean'], name='Mean altitude (m)',
+                                      mode='lines', line=dict(color='#2196F3')))
+    if 'velocity_mean' in series.columns:
+        mean_fig.add_trace(go.Scatter(x=series.index, y=series['velocity_mean'], name='Mean speed (m/s)',
+                                      mode='lines', line=dict(color='#4CAF50'), yaxis='y2'))
+    mean_fig.update_layout(
+        title=dict(text='Mean Airborne Altitude and Speed', font=dict(size=18), x=0.5),
+        yaxis=dict(title='Altitude (m)'),
+        yaxis2=dict(title='Speed (m/s)', overlaying='y', side='right'),
+        margin=dict(t=60, b=40, l=0, r=0),
+        legend=dict(orientation='h', y=-0.15)
+    )
+
+    country_fig = go.Figure()
+    for country in countries.columns:
+        country_fig.add_trace(go.Scatter(x=countries.index, y=countries[country], name=country, mode='lines'))
+    country_fig.update_layout(
+        title=dict(text='Top Origin Countries over Time', font=dict(size=18), x=0.5),
+        yaxis_title='Number of Aircraft',
+        margin=dict(t=60, b=40, l=0, r=0),
+        legend=dict(orientation='h', y=-0.15)
+    )
+    return phase_fig, mean_fig, country_fig
 
 def layout():
     """Build the statistics page layout"""
@@ -40,11 +106,11 @@ def update_statistics_content(pathname):
     try:
         start_time = datetime.now()
         
-        # Get statistics data - caching logic handled in query_cache
-        last_timestamp_df = get_stats_data()
+        # Get statistics aggregates - caching logic handled in get_flight_stats
+        stats = get_stats_data()
         
         # Check if we have valid data
-        if last_timestamp_df is None or last_timestamp_df.empty:
+        if stats is None or stats['total'] == 0:
             return html.Div([
                 dbc.Container([
                     dbc.Row([
@@ -85,46 +151,13 @@ def update_statistics_content(pathname):
             
             # Process the flight data for visualization
             try:
-                # Create a copy to avoid modifying the cached dataframe
-                processed_df = last_timestamp_df.copy()
-                
                 # Direct assignments based on known column names
                 altitude_col = 'geo_altitude'
                 velocity_col = 'velocity'
-                origin_country_col = 'origin_country'
-                vertical_rate_col = 'vertical_rate'
-                callsign_col = 'callsign'
-                
-                # Categorize flight phases
-                def categorize_phase(row):
-                    # First check if the flight is on ground
-                    if row['on_ground'] == True:
-                        return 'On Ground'
-                    
-                    # Check if we have vertical rate info for more precise categorization
-                    if vertical_rate_col in processed_df.columns and vertical_rate_col in row and not pd.isna(row[vertical_rate_col]):
-                        vrate = row[vertical_rate_col]
-                        if vrate > 2.5:
-                            return 'Ascending'
-                        elif vrate < -2.5:
-                            return 'Descending'
-                    
-                    # If not climbing or descending, it's cruising
-                    return 'Cruising'
-                
-                # Apply the categorization
-                processed_df['flight_phase'] = processed_df.apply(categorize_phase, axis=1)
-                
-                # Count flights by phase
-                phase_counts = processed_df['flight_phase'].value_counts().reset_index()
-                phase_counts.columns = ['Flight Phase', 'Count']
-                
-                # Get total flights
-                total_flights = len(processed_df)
                 
                 # Calculate flight status metrics
-                status_counts = processed_df['flight_phase'].value_counts()
-                total_aircraft = len(processed_df)
+                status_counts = stats['phases']
+                total_aircraft = stats['total']
                 on_ground = status_counts.get('On Ground', 0)
                 in_air = total_aircraft - on_ground
                 ascending = status_counts.get('Ascending', 0)
@@ -158,25 +191,12 @@ def update_statistics_content(pathname):
                 
                 # 2. Altitude histogram
                 alt_fig = go.Figure()
-                if altitude_col in processed_df.columns:
-                    altitude_data = processed_df[~processed_df.get('on_ground', False)][altitude_col].dropna()
-                    if len(altitude_data) > 0:
-                        alt_fig = px.histogram(altitude_data, nbins=50, opacity=0.7, 
-                                              color_discrete_sequence=['#2196F3'])
-                        mean_altitude = altitude_data.mean()
-                        alt_fig.add_vline(x=mean_altitude, line_dash='dash', line_color='red')
-                        
-                        y_data = alt_fig.data[0]['y'] if alt_fig.data and 'y' in alt_fig.data[0] else None
-                        if y_data is not None and len(y_data) > 0:
-                            alt_fig.add_annotation(x=mean_altitude, y=max(y_data),
-                                text=f"Mean: {mean_altitude:.0f} m", showarrow=False, yshift=20, font=dict(color='red'))
-                        
-                        alt_fig.update_layout(
-                            title=dict(text='Altitude Distribution', font=dict(size=18), x=0.5),
-                            xaxis_title=f'Altitude ({altitude_col}) in meters',
-                            yaxis_title='Number of Aircraft',
-                            margin=dict(t=60, b=40, l=0, r=0),
-                            xaxis=dict(range=[0, 15000])
+                altitude_hist = stats['histograms'].get(altitude_col)
+                if altitude_hist is not None:
+                    if altitude_hist['counts'].sum() > 0:
+                        alt_fig = create_histogram_figure(
+                            altitude_hist, '#2196F3', 'Altitude Distribution',
+                            f'Altitude ({altitude_col}) in meters', 'm', '.0f', 15000
                         )
                     else:
                         alt_fig.add_annotation(text='No airborne altitude data available', x=0.5, y=0.5, showarrow=False)
@@ -185,25 +205,12 @@ def update_statistics_content(pathname):
                 
                 # 3. Speed histogram
                 speed_fig = go.Figure()
-                if velocity_col in processed_df.columns:
-                    velocity_data = processed_df[~processed_df.get('on_ground', False)][velocity_col].dropna()
-                    if len(velocity_data) > 0:
-                        speed_fig = px.histogram(velocity_data, nbins=50, opacity=0.7,
-                                                color_discrete_sequence=['#4CAF50'])
-                        mean_velocity = velocity_data.mean()
-                        speed_fig.add_vline(x=mean_velocity, line_dash='dash', line_color='red')
-                        
-                        y_data = speed_fig.data[0]['y'] if speed_fig.data and 'y' in speed_fig.data[0] else None
-                        if y_data is not None and len(y_data) > 0:
-                            speed_fig.add_annotation(x=mean_velocity, y=max(y_data),
-                                text=f"Mean: {mean_velocity:.1f} m/s", showarrow=False, yshift=20, font=dict(color='red'))
-                        
-                        speed_fig.update_layout(
-                            title=dict(text='Speed Distribution', font=dict(size=18), x=0.5),
-                            xaxis_title=f'Speed ({velocity_col}) in m/s',
-                            yaxis_title='Number of Aircraft',
-                            margin=dict(t=60, b=40, l=0, r=0),
-                            xaxis=dict(range=[0, 350])
+                velocity_hist = stats['histograms'].get(velocity_col)
+                if velocity_hist is not None:
+                    if velocity_hist['counts'].sum() > 0:
+                        speed_fig = create_histogram_figure(
+                            velocity_hist, '#4CAF50', 'Speed Distribution',
+                            f'Speed ({velocity_col}) in m/s', 'm/s', '.1f', 350
                         )
                     else:
                         speed_fig.add_annotation(text='No airborne velocity data available', x=0.5, y=0.5, showarrow=False)
@@ -212,27 +219,44 @@ def update_statistics_content(pathname):
                 
                 # 4. Country histogram
                 country_fig = go.Figure()
-                if origin_country_col in processed_df.columns:
-                    country_counts = processed_df[origin_country_col].value_counts().head(15)
-                    if len(country_counts) > 0:
-                        country_fig = go.Figure(go.Bar(
-                            y=country_counts.index[::-1],
-                            x=country_counts.values[::-1],
-                            orientation='h',
-                            marker_color='#FF9800',
-                            text=country_counts.values[::-1],
-                            textposition='auto'
-                        ))
-                        country_fig.update_layout(
-                            title=dict(text='Top Flight Origin Countries', font=dict(size=18), x=0.5),
-                            xaxis_title='Number of Aircraft',
-                            yaxis_title='',
-                            margin=dict(t=60, b=40, l=0, r=0)
-                        )
-                    else:
-                        country_fig.add_annotation(text='No country data available', x=0.5, y=0.5, showarrow=False)
+                country_counts = stats['countries']
+                if len(country_counts) > 0:
+                    country_fig = go.Figure(go.Bar(
+                        y=country_counts.index[::-1],
+                        x=country_counts.values[::-1],
+                        orientation='h',
+                        marker_color='#FF9800',
+                        text=country_counts.values[::-1],
+                        textposition='auto'
+                    ))
+                    country_fig.update_layout(
+                        title=dict(text='Top Flight Origin Countries', font=dict(size=18), x=0.5),
+                        xaxis_title='Number of Aircraft',
+                        yaxis_title='',
+                        margin=dict(t=60, b=40, l=0, r=0)
+                    )
                 else:
-                    country_fig.add_annotation(text='Country data not available', x=0.5, y=0.5, showarrow=False)
+                    country_fig.add_annotation(text='No country data available', x=0.5, y=0.5, showarrow=False)
+                
+                # 5. Trends over the rolling fleet window
+                series, series_countries = get_fleet_series()
+                if len(series) > 1:
+                    phase_trend_fig, mean_trend_fig, country_trend_fig = create_trend_figures(
+                        series, series_countries, status_colors)
+                    trend_rows = [
+                        html.H5(f"Trends over the last {(series.index[-1] - series.index[0]).total_seconds() / 3600:.1f} hours "
+                                f"({len(series)} snapshots)", className="mt-4 mb-3 fw-bold"),
+                        dbc.Row([
+                            dbc.Col(dcc.Graph(figure=phase_trend_fig), width=6),
+                            dbc.Col(dcc.Graph(figure=mean_trend_fig), width=6)
+                        ]),
+                        dbc.Row([
+                            dbc.Col(dcc.Graph(figure=country_trend_fig), width=12)
+                        ])
+                    ]
+                else:
+                    trend_rows = [html.P("Trends appear once a few live snapshots have been recorded.",
+                                         className="text-muted mt-4")]
                 
                 # Create stats table
                 stats_df = pd.DataFrame({
@@ -263,75 +287,21 @@ def update_statistics_content(pathname):
                 })
                 
                 # Find records (fastest, highest aircraft)
+                record_formats = {
+                    'Fastest Plane': lambda v: f"{v * 3.6:.1f} km/h",
+                    'Highest Plane': lambda v: f"{v:.1f} m",
+                    'Max Climb Rate': lambda v: f"{v:.1f} m/s",
+                    'Max Descent Rate': lambda v: f"{v:.1f} m/s"
+                }
                 records_table_rows = []
-                
-                # Filter out planes on ground
-                airborne_df = processed_df[~processed_df.get('on_ground', False)]
-                
-                # Only proceed if we have airborne planes
-                if not airborne_df.empty and callsign_col in processed_df.columns and origin_country_col in processed_df.columns:
-                    # Get fastest plane
-                    if velocity_col in processed_df.columns:
-                        fastest_idx = airborne_df[velocity_col].idxmax()
-                        if fastest_idx is not None:
-                            fastest_plane = airborne_df.loc[fastest_idx]
-                            fastest_callsign = fastest_plane.get(callsign_col, 'N/A')
-                            fastest_speed = fastest_plane.get(velocity_col, 'N/A')
-                            fastest_country = fastest_plane.get(origin_country_col, 'N/A')
-                            country_flag = get_country_flag_emoji(fastest_country)
-                            records_table_rows.append({
-                                'Category': 'Fastest Plane',
-                                'Callsign': f"{country_flag} {fastest_callsign}",
-                                'Value': f"{fastest_speed * 3.6:.1f} km/h" if isinstance(fastest_speed, (int, float)) else fastest_speed,
-                                'Country': fastest_country
-                            })
-                    
-                    # Get highest plane
-                    if altitude_col in processed_df.columns:
-                        highest_idx = airborne_df[altitude_col].idxmax()
-                        if highest_idx is not None:
-                            highest_plane = airborne_df.loc[highest_idx]
-                            highest_callsign = highest_plane.get(callsign_col, 'N/A')
-                            highest_altitude = highest_plane.get(altitude_col, 'N/A')
-                            highest_country = highest_plane.get(origin_country_col, 'N/A')
-                            country_flag = get_country_flag_emoji(highest_country)
-                            records_table_rows.append({
-                                'Category': 'Highest Plane',
-                                'Callsign': f"{country_flag} {highest_callsign}",
-                                'Value': f"{highest_altitude:.1f} m" if isinstance(highest_altitude, (int, float)) else highest_altitude,
-                                'Country': highest_country
-                            })
-                    
-                    # Get highest ascent rate
-                    if vertical_rate_col in processed_df.columns:
-                        highest_ascent_idx = airborne_df[vertical_rate_col].idxmax()
-                        if highest_ascent_idx is not None:
-                            ascent_plane = airborne_df.loc[highest_ascent_idx]
-                            ascent_callsign = ascent_plane.get(callsign_col, 'N/A')
-                            ascent_rate = ascent_plane.get(vertical_rate_col, 'N/A')
-                            ascent_country = ascent_plane.get(origin_country_col, 'N/A')
-                            country_flag = get_country_flag_emoji(ascent_country)
-                            records_table_rows.append({
-                                'Category': 'Max Climb Rate',
-                                'Callsign': f"{country_flag} {ascent_callsign}",
-                                'Value': f"{ascent_rate:.1f} m/s" if isinstance(ascent_rate, (int, float)) else ascent_rate,
-                                'Country': ascent_country
-                            })
-                        
-                        # Get highest descent rate
-                        highest_descent_idx = airborne_df[vertical_rate_col].idxmin()
-                        if highest_descent_idx is not None:
-                            descent_plane = airborne_df.loc[highest_descent_idx]
-                            descent_callsign = descent_plane.get(callsign_col, 'N/A')
-                            descent_rate = descent_plane.get(vertical_rate_col, 'N/A')
-                            descent_country = descent_plane.get(origin_country_col, 'N/A')
-                            country_flag = get_country_flag_emoji(descent_country)
-                            records_table_rows.append({
-                                'Category': 'Max Descent Rate',
-                                'Callsign': f"{country_flag} {descent_callsign}",
-                                'Value': f"{descent_rate:.1f} m/s" if isinstance(descent_rate, (int, float)) else descent_rate,
-                                'Country': descent_country
-                            })
+                for record in stats['records']:
+                    country_flag = get_country_flag_emoji(record['country'])
+                    records_table_rows.append({
+                        'Category': record['category'],
+                        'Callsign': f"{country_flag} {record['callsign'] if record['callsign'] is not None else 'N/A'}",
+                        'Value': record_formats[record['category']](record['value']),
+                        'Country': record['country'] if record['country'] is not None else 'N/A'
+                    })
                 
                 records_df = pd.DataFrame(records_table_rows) if records_table_rows else pd.DataFrame({
                     'Category': ['No Data Available'],
@@ -374,7 +344,9 @@ def update_statistics_content(pathname):
                                     dbc.Row([
                                         dbc.Col(dcc.Graph(figure=alt_fig), width=6),
                                         dbc.Col(dcc.Graph(figure=speed_fig), width=6)
-                                    ])
+                                    ]),
+                                    
+                                    *trend_rows
                                 ])
                             ], className="shadow-lg mb-5")
                         ], width=12)
@@ -3,6 +3,9 @@ from dash import html, dcc, Output, Input, State, clientside_callback, callback
 import dash_bootstrap_components as dbc
 import pandas as pd
 from utils.database import *
+from utils.live_feed import PlaneFeed, drop_stale_planes
+from utils.spatial import viewport_bounds
+from utils.clusters import SnapshotClusters, clusters_in_view
 import traceback
 
 import json
@@ -11,6 +14,30 @@ from datetime import datetime, timedelta, timezone
 # Register the page
 dash.register_page(__name__, path="/streaming")
 
+# Recent projected snapshots shared by all clients, used to send deltas
+plane_feed = PlaneFeed(history=config.get("live_feed_history", 16))
+
+# With live_push the map subscribes to /stream/planes instead of Interval polling
+LIVE_PUSH = config.get("live_push", False)
+
+# "json" records or "bin" for the compact utils.wire table
+FEED_ENCODING = config.get("live_feed_encoding", "json")
+# Dead-reckoning animation between snapshots; allows a longer ui_refresh_interval
+LIVE_MAP_ANIMATION = config.get("live_map_animation", False)
+MAP_PARAMS = ([f"push=1&format={FEED_ENCODING}"] if LIVE_PUSH else []) + (["animate=1"] if LIVE_MAP_ANIMATION else [])
+MAP_SRC = "/static/streaming_map.html" + ("?" + "&".join(MAP_PARAMS) if MAP_PARAMS else "")
+
+# Only send aircraft inside the map's (padded) viewport; push channels are shared, so polling only
+VIEWPORT_CULLING = config.get("viewport_culling", True) and not LIVE_PUSH
+VIEWPORT_PADDING = config.get("viewport_padding", 0.25)
+
+# Below this zoom the map gets clustered counts instead of single aircraft (needs the viewport)
+CLUSTER_BELOW_ZOOM = config.get("cluster_below_zoom", 6) if VIEWPORT_CULLING else None
+plane_clusters = SnapshotClusters(
+    tiers=config.get("cluster_zoom_tiers", [2, 3, 4, 5]),
+    cell_pixels=config.get("cluster_cell_pixels", 64)
+)
+
 # Define country options function to be called when needed
 def get_country_options():
     COUNTRY_COLUMN = 'origin_country'
@@ -66,16 +93,28 @@ def layout():
                             disabled=True
                         ),
                         
-                        # Store for plane data
+                        # Store for plane updates (full snapshot or delta)
                         dcc.Store(
                             id="streaming-plane-data",
-                            data={"planes": [], "last_refresh": None, "status": "initializing"}
+                            data={"update": None, "last_refresh": None, "status": "initializing"}
                         ),
                         
+                        # Feed version the map iframe currently shows
+                        dcc.Store(id="streaming-plane-version", data=None),
+                        
+                        # Extent and zoom reported by the map iframe, checked every second
+                        dcc.Interval(
+                            id="streaming-viewport-interval",
+                            interval=1000,
+                            n_intervals=0,
+                            disabled=not VIEWPORT_CULLING
+                        ),
+                        dcc.Store(id="streaming-viewport", data=None),
+                        
                         # The map iframe
                         html.Iframe(
                             id="streaming-map-iframe",
-                            src="/static/streaming_map.html",
+                            src=MAP_SRC,
                             style={
                                 "width": "100%",
                                 "height": "80vh",  # Responsive height
@@ -97,7 +136,7 @@ def layout():
 )
 def enable_interval(pathname):
     """Enable/disable the update interval based on the current page"""
-    return pathname != "/streaming"
+    return LIVE_PUSH or pathname != "/streaming"
 
 @callback(
     Output("streaming-country-selector", "options"),
@@ -117,17 +156,24 @@ def populate_country_options(pathname):
      Output("streaming-map-iframe", "style"),
      Output("streaming-country-selector", "style")],
     [Input("streaming-interval", "n_intervals"),
-     Input("streaming-country-selector", "value")],
+     Input("streaming-country-selector", "value"),
+     Input("streaming-viewport", "data")],
+    State("streaming-plane-version", "data"),
     prevent_initial_call=True
 )
-def update_plane_data(n_intervals, selected_country):
-    """Update plane data from the database"""
+def update_plane_data(n_intervals, selected_country, viewport, client_version):
+    """Send the map the plane changes since the version it currently shows"""
+    if LIVE_PUSH:
+        return dash.no_update, dash.no_update, dash.no_update
     try:
         # Get current timestamp for performance monitoring
         start_time = datetime.now()
         
 
-        df = get_latest_flights(selected_country)
+        # Only aircraft inside the padded viewport are sent to the map
+        bounds = viewport_bounds(viewport, VIEWPORT_PADDING) if VIEWPORT_CULLING else None
+        # One snapshot for both, so the version always labels the planes that are sent
+        df, in_view = get_latest_flights_view(selected_country, bounds)
         #print(f"[Streaming DEBUG] DataFrame dtypes:\n{df.dtypes}")
         #print(f"[Streaming DEBUG] DataFrame columns: {df.columns.tolist()}")
         #print(f"[Streaming DEBUG] First row of data:")
@@ -181,32 +227,47 @@ def update_plane_data(n_intervals, selected_country):
             error_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
             return {
-                "planes": [],
+                "update": None,
                 "last_refresh": error_time,
                 "status": "error"
-            }, None, iframe_style, country_selector_style
+            }, iframe_style, country_selector_style
             
         # Ensure time_position is a datetime before filtering
         #if 'time_position' in df.columns:
         #    df['time_position'] = pd.to_datetime(df['time_position'], utc=True, errors='coerce')
 
 
-        old_no_planes = len(df)       
-        recent_time_position = df['time_position'].max()
         recent_timestamp = df['ingest_time'].max()
+        newest_position = df['time_position'].max()
 
         current_time = datetime.now(timezone.utc)
         ui_time_diff = int((current_time - recent_timestamp).total_seconds())
 
-        # Filter out rows older than x minutes, 2 minutes is the default
+        version = f"{selected_country or 'ALL'}@{recent_timestamp.isoformat()}"
         filter_minutes = config.get('filter_old_planes_minutes', 2) 
-        df = df[df['time_position'] > (recent_time_position - timedelta(minutes=filter_minutes))]        
-        print(f"[Streaming] Time filter removed {old_no_planes - len(df)} rows from {old_no_planes} rows")
+        zoom = viewport.get("zoom") if viewport else None
+
+        if CLUSTER_BELOW_ZOOM and zoom is not None and zoom < CLUSTER_BELOW_ZOOM:
+            # Zoomed out: clustered counts, computed once per snapshot for all tiers
+            df = drop_stale_planes(df, filter_minutes, newest_position)
+            plane_update = {
+                "mode": "clusters",
+                "version": version + "#clusters",
+                "count": len(df),
+                "clusters": clusters_in_view(plane_clusters.get(version, df), zoom, bounds)
+            }
+        else:
+            df = in_view
+            old_no_planes = len(df)       
 
-        # convert time_position to string before sending 
-        df['time_position'] = df['time_position'].dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            # Filter out rows older than x minutes, 2 minutes is the default
+            df = drop_stale_planes(df, filter_minutes, newest_position)
+            print(f"[Streaming] Time filter removed {old_no_planes - len(df)} rows from {old_no_planes} rows")
 
-        planes_data = df.to_dict("records")
+            # Only added, moved and removed aircraft are sent once the map has a base version
+            if bounds is not None:
+                version += "#" + ",".join(f"{v:g}" for v in bounds)
+            plane_update = plane_feed.payload(df, version, client_version, encoding=FEED_ENCODING)
 
         # avoid microseconds in the last refresh time
         ui_last_refresh = current_time.strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -229,7 +290,7 @@ def update_plane_data(n_intervals, selected_country):
         country_selector_style = {"width": "100%"}
                 
         return {
-            "planes":        planes_data,
+            "update":        plane_update,
             "last_refresh":  ui_last_refresh,
             "last_data":     ui_last_data,
             "last_time_diff": ui_time_diff,
@@ -288,41 +349,51 @@ def update_plane_data(n_intervals, selected_country):
         country_selector_style = {"display": "none"}
         
         return {
-            "planes": [],
+            "update": None,
             "last_refresh": error_time,
             "status": "error"
-        }, None, iframe_style, country_selector_style
+        }, iframe_style, country_selector_style
 
 # Clientside callback to update the map
 clientside_callback(
     """
-    function(data) {
+    function(data, currentVersion) {
         console.log('[Streaming] Clientside callback triggered:', data);
+        const noUpdate = window.dash_clientside.no_update;
         
         // Get the iframe
         const iframe = document.getElementById('streaming-map-iframe');
         if (!iframe) {
             console.error('[Streaming] Iframe not found');
-            return "Error: iframe not found";
+            return ["Error: iframe not found", null];
         }
         
         // Check if we have valid data
-        if (!data || !data.planes) {
+        if (!data || !data.update) {
             console.error('[Streaming] Invalid data format:', data);
-            return "Error: invalid data";
+            return ["Error: invalid data", null];
+        }
+        
+        // Until the map is ready, or after it missed a delta, request a full snapshot
+        const mapWindow = iframe.contentWindow;
+        if (!mapWindow || !mapWindow.mapReady || (mapWindow.planeSyncFailed && data.update.mode === 'delta')) {
+            console.log('[Streaming] Map not in sync, requesting full snapshot');
+            return ["Waiting for map", null];
         }
         
         try {
+            const update = data.update;
             // Log the update
             console.log(
-                `[Streaming] Sending ${data.planes.length} planes to map at ${data.last_refresh}`
+                `[Streaming] Sending ${update.mode} ${update.encoding || 'json'} update for ` +
+                `${update.count} planes to map at ${data.last_refresh}`
             );
             
-            // Send the data to the iframe
-            iframe.contentWindow.postMessage(
+            // Send the update to the iframe
+            mapWindow.postMessage(
                 {
-                    type: 'plane_data',
-                    planes: data.planes,
+                    type: 'plane_update',
+                    update: update,
                     ui_last_refresh: data.last_refresh,
                     ui_last_data: data.last_data,
                     ui_time_diff: data.last_time_diff,
@@ -331,14 +402,48 @@ clientside_callback(
                 '*'
             );
             
-            return `Updated: ${data.last_refresh}`;
+            return [`Updated: ${data.last_refresh}`, update.version === currentVersion ? noUpdate : update.version];
             
         } catch (error) {
             console.error('[Streaming] Error in clientside callback:', error);
-            return `Error: ${error.message}`;
+            return [`Error: ${error.message}`, null];
         }
     }
     """,
-    Output('streaming-map-iframe', 'title'),
-    Input('streaming-plane-data', 'data')
-)
\ No newline at end of file
+    [Output('streaming-map-iframe', 'title'),
+     Output('streaming-plane-version', 'data')],
+    Input('streaming-plane-data', 'data'),
+    State('streaming-plane-version', 'data')
+)
+
+# In push mode the map owns its subscription; tell it which country to follow
+clientside_callback(
+    """
+    function(country) {
+        const iframe = document.getElementById('streaming-map-iframe');
+        if (iframe && iframe.contentWindow) {
+            iframe.contentWindow.postMessage({type: 'plane_subscribe', country: country || null}, '*');
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output('debug-info', 'children'),
+    Input('streaming-country-selector', 'value')
+)
+
+# Copy the viewport the map iframe reports into streaming-viewport when it changes
+clientside_callback(
+    """
+    function(n, current) {
+        const iframe = document.getElementById('streaming-map-iframe');
+        const viewport = iframe && iframe.contentWindow ? iframe.contentWindow.mapViewport : null;
+        if (!viewport || JSON.stringify(viewport) === JSON.stringify(current)) {
+            return window.dash_clientside.no_update;
+        }
+        return viewport;
+    }
+    """,
+    Output('streaming-viewport', 'data'),
+    Input('streaming-viewport-interval', 'n_intervals'),
+    State('streaming-viewport', 'data')
+)
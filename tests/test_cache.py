@@ -0,0 +1,148 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from utils import cache as cache_module
+from utils.cache import QueryCache, _estimate_size
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def test_concurrent_misses_share_one_load():
+    cache = QueryCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "rows"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("t", loader, 60))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ["rows"] * 8
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = QueryCache()
+    values = iter(["first", "second"])
+    loader = lambda: next(values)
+
+    assert cache.get("t", loader, 10) == "first"
+    clock.now += 9
+    assert cache.get("t", loader, 10) == "first"
+    clock.now += 2
+    assert cache.get("t", loader, 10) == "second"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_stale_entries_are_served_while_one_refresh_runs(clock):
+    cache = QueryCache(stale_seconds=30)
+    cache.get("t", lambda: "old", 10)
+    clock.now += 15
+    refreshed = threading.Event()
+
+    def loader():
+        refreshed.set()
+        return "new"
+
+    assert cache.get("t", loader, 10) == "old"
+    assert refreshed.wait(5)
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.get("a", lambda: "a", 60)
+    cache.get("b", lambda: "b", 60)
+    cache.get("a", lambda: "a", 60)
+    cache.get("c", lambda: "c", 60)
+
+    loads = []
+    cache.get("b", lambda: loads.append("b") or "b", 60)
+    assert loads == ["b"]
+    assert cache.stats()["entries"] == 2
+
+
+def test_entries_are_evicted_beyond_max_bytes():
+    frame = pd.DataFrame({"name": ["x" * 100] * 100})
+    cache = QueryCache(max_bytes=int(_estimate_size(frame) * 1.5))
+    cache.get("a", lambda: frame, 60)
+    cache.get("b", lambda: frame.copy(), 60)
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == _estimate_size(frame)
+
+
+def test_loader_errors_reach_every_waiting_caller_and_are_not_cached():
+    cache = QueryCache()
+
+    def failing():
+        raise RuntimeError("warehouse down")
+
+    with pytest.raises(RuntimeError, match="warehouse down"):
+        cache.get("t", failing, 60)
+    with pytest.raises(RuntimeError, match="warehouse down"):
+        cache.refresh("t", failing, 60)
+    assert cache.get("t", lambda: "rows", 60) == "rows"
+
+
+def test_none_results_are_not_stored():
+    cache = QueryCache()
+    assert cache.get("t", lambda: None, 60) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_warm_entries_are_served_and_reloaded_in_the_background():
+    stored = []
+    cache = QueryCache(on_store=lambda key, data: stored.append((key, data)))
+    cache.warm("t", "restored")
+    reloaded = threading.Event()
+
+    def loader():
+        reloaded.set()
+        return "fresh"
+
+    assert cache.get("t", loader, 60) == "restored"
+    assert reloaded.wait(5)
+    for _ in range(100):
+        if stored:
+            break
+        threading.Event().wait(0.01)
+    assert stored == [("t", "fresh")]
+    assert cache.get("t", loader, 60) == "fresh"
+
+
+def test_size_estimate_counts_strings_and_containers():
+    frame = pd.DataFrame({"name": ["x" * 1000] * 10})
+    assert _estimate_size(frame) > 10 * 1000
+    assert _estimate_size({"a": frame}) > _estimate_size(frame)
+    assert _estimate_size(5) > 0
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.clusters import SnapshotClusters, cluster_planes, clusters_in_view
+
+
+def flights(lon, lat):
+    return pd.DataFrame({"longitude": lon, "latitude": lat})
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    rng = np.random.default_rng(5)
+    lon = rng.uniform(-180, 180, 3000)
+    lat = rng.uniform(-85, 85, 3000)
+    lon[:5] = np.nan
+    return flights(lon, lat)
+
+
+def test_every_valid_aircraft_is_in_one_cluster_per_tier(snapshot):
+    clusters = cluster_planes(snapshot, tiers=(0, 2, 4))
+    for tier, rows in clusters.items():
+        assert rows[:, 2].sum() == len(snapshot) - 5
+
+
+def test_finer_tiers_have_more_clusters(snapshot):
+    clusters = cluster_planes(snapshot, tiers=(1, 3, 5))
+    assert len(clusters[1]) < len(clusters[3]) < len(clusters[5])
+
+
+def test_clusters_sit_at_the_mean_position():
+    clusters = cluster_planes(flights([8.0, 8.2, -70.0], [47.0, 47.4, -30.0]), tiers=(2,))
+    rows = sorted(clusters[2].tolist(), key=lambda row: row[2])
+    assert rows[0] == pytest.approx([-70.0, -30.0, 1])
+    assert rows[1] == pytest.approx([8.1, 47.2, 2])
+
+
+def test_empty_snapshot():
+    assert len(cluster_planes(pd.DataFrame(), tiers=(2,))[2]) == 0
+    assert clusters_in_view({}, 3) == {}
+
+
+def test_clusters_in_view_picks_the_tier_at_or_below_the_zoom(snapshot):
+    clusters = cluster_planes(snapshot, tiers=(2, 4))
+    assert list(clusters_in_view(clusters, 3)) == ["2"]
+    assert list(clusters_in_view(clusters, 4.5)) == ["4"]
+    assert list(clusters_in_view(clusters, 0)) == ["2"]
+
+
+def test_clusters_in_view_filters_by_bounds_across_the_antimeridian():
+    clusters = cluster_planes(flights([179.0, -179.0, 0.0], [0.0, 0.0, 0.0]), tiers=(4,))
+    rows = clusters_in_view(clusters, 4, bounds=(170.0, -10.0, 190.0, 10.0))["4"]
+    assert sorted(row[0] for row in rows) == [-179.0, 179.0]
+    assert all(isinstance(row[2], int) for row in rows)
+
+
+def test_snapshot_clusters_compute_once_per_version(snapshot):
+    cache = SnapshotClusters(tiers=(2,), history=1)
+    first = cache.get("v1", snapshot)
+    assert cache.get("v1", None) is first
+    cache.get("v2", snapshot)
+    assert cache.get("v1", snapshot) is not first
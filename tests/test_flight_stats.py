@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.flight_stats import (
+    HISTOGRAM_BINS, HISTOGRAM_RANGES, RECORDS, compute_flight_stats, flight_stats_queries, parse_flight_stats
+)
+
+
+def snapshot(n=500, seed=7):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "callsign": [f"CS{i}" for i in range(n)],
+        "origin_country": rng.choice(["Germany", "France", "Spain", "Italy"], n, p=[0.4, 0.3, 0.2, 0.1]),
+        "on_ground": rng.random(n) < 0.2,
+        "vertical_rate": rng.normal(0, 5, n),
+        # Some values outside the histogram ranges, and one on each upper edge
+        "geo_altitude": rng.uniform(-100, 16000, n),
+        "velocity": rng.uniform(0, 400, n)
+    })
+    df.loc[3, ["on_ground", "geo_altitude", "velocity"]] = [False, 15000.0, 350.0]
+    df.loc[5, "vertical_rate"] = np.nan
+    return df
+
+
+def warehouse_results(df, climb_rate=2.5, descent_rate=-2.5):
+    """What the flight_stats_queries return for df, computed the way the SQL does."""
+    on_ground = df["on_ground"].fillna(False).astype(bool)
+    airborne = df[~on_ground]
+    summary = {
+        "total": len(df),
+        "on_ground": int(on_ground.sum()),
+        "ascending": int((airborne["vertical_rate"] > climb_rate).sum()),
+        "descending": int((airborne["vertical_rate"] < descent_rate).sum()),
+        "geo_altitude_mean": airborne["geo_altitude"].mean(),
+        "velocity_mean": airborne["velocity"].mean()
+    }
+    for i, (_, column, extreme) in enumerate(RECORDS):
+        idx = airborne[column].idxmax() if extreme == "max" else airborne[column].idxmin()
+        summary[f"record{i}_callsign"] = airborne.at[idx, "callsign"]
+        summary[f"record{i}_country"] = airborne.at[idx, "origin_country"]
+        summary[f"record{i}_value"] = airborne.at[idx, column]
+
+    histogram_rows = []
+    for column, (low, high) in HISTOGRAM_RANGES.items():
+        values = airborne[column]
+        values = values[(values >= low) & (values <= high)]
+        # width_bucket(v, low, high, bins)
+        buckets = np.floor((values - low) * HISTOGRAM_BINS / (high - low)).astype(int) + 1
+        for bucket, count in buckets.value_counts().items():
+            histogram_rows.append({"metric": column, "bucket": bucket, "count": count})
+
+    countries = df["origin_country"].value_counts().head(15)
+    return {
+        "summary": pd.DataFrame([summary]),
+        "histograms": pd.DataFrame(histogram_rows, columns=["metric", "bucket", "count"]),
+        "countries": pd.DataFrame({"origin_country": countries.index, "count": countries.to_numpy()})
+    }
+
+
+def test_pushdown_matches_local_computation():
+    df = snapshot()
+    local = compute_flight_stats(df)
+    pushed = parse_flight_stats(warehouse_results(df))
+
+    assert pushed["total"] == local["total"]
+    assert pushed["phases"].to_dict() == local["phases"].to_dict()
+    assert pushed["countries"].to_dict() == local["countries"].to_dict()
+    for column in HISTOGRAM_RANGES:
+        np.testing.assert_array_equal(pushed["histograms"][column]["counts"], local["histograms"][column]["counts"])
+        np.testing.assert_array_equal(pushed["histograms"][column]["edges"], local["histograms"][column]["edges"])
+        assert pushed["histograms"][column]["mean"] == pytest.approx(local["histograms"][column]["mean"])
+    assert pushed["records"] == local["records"]
+
+
+def test_histograms_count_the_upper_edge_in_the_last_bin():
+    stats = compute_flight_stats(snapshot())
+    pushed = parse_flight_stats(warehouse_results(snapshot()))
+    assert stats["histograms"]["geo_altitude"]["counts"][-1] == pushed["histograms"]["geo_altitude"]["counts"][-1] > 0
+
+
+def test_empty_inputs_give_empty_stats():
+    assert compute_flight_stats(pd.DataFrame())["total"] == 0
+    results = {"summary": pd.DataFrame([{"total": 0}]), "histograms": pd.DataFrame(), "countries": pd.DataFrame()}
+    stats = parse_flight_stats(results)
+    assert stats["total"] == 0
+    assert stats["records"] == []
+
+
+def test_queries_use_the_table_and_thresholds():
+    queries = flight_stats_queries("c.s.last_timestamp", climb_rate=3.0, descent_rate=-4.0)
+    assert set(queries) == {"summary", "histograms", "countries"}
+    assert all("c.s.last_timestamp" in query for query in queries.values())
+    assert "vertical_rate > 3.0" in queries["summary"]
+    assert "vertical_rate < -4.0" in queries["summary"]
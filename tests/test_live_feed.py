@@ -0,0 +1,91 @@
+import pandas as pd
+
+from utils.live_feed import PlaneFeed, diff_planes, drop_stale_planes, project_planes
+
+T0 = pd.Timestamp("2024-05-01 12:00:00", tz="UTC")
+
+
+def snapshot(rows):
+    """rows: [(icao24, longitude, latitude, seconds after T0)]"""
+    return pd.DataFrame({
+        "icao24": [r[0] for r in rows],
+        "callsign": [f"CS{r[0]}" for r in rows],
+        "origin_country": ["Germany"] * len(rows),
+        "longitude": [r[1] for r in rows],
+        "latitude": [r[2] for r in rows],
+        "velocity": [200.0] * len(rows),
+        "true_track": [90.0] * len(rows),
+        "time_position": [T0 + pd.Timedelta(seconds=r[3]) for r in rows],
+        "geo_altitude": [10000.0] * len(rows)
+    })
+
+
+def test_project_planes_keeps_rendered_columns_and_last_duplicate():
+    df = snapshot([("a", 1.0, 2.0, 0), ("a", 3.0, 4.0, 5), ("b", 5.0, 6.0, 0)])
+    planes = project_planes(df)
+    assert list(planes.index) == ["a", "b"]
+    assert "geo_altitude" not in planes.columns
+    assert planes.loc["a", "longitude"] == 3.0
+
+
+def test_drop_stale_planes_uses_the_newest_position():
+    df = snapshot([("a", 1.0, 2.0, 0), ("b", 1.0, 2.0, 600)])
+    assert list(drop_stale_planes(df, 2)["icao24"]) == ["b"]
+    assert list(drop_stale_planes(df, 2, newest=T0 + pd.Timedelta(seconds=60))["icao24"]) == ["a", "b"]
+
+
+def test_diff_planes_reports_added_updated_and_removed():
+    before = project_planes(snapshot([("a", 1.0, 2.0, 0), ("b", 1.0, 2.0, 0), ("c", 1.0, 2.0, 0)]))
+    after = project_planes(snapshot([("a", 1.0, 2.0, 0), ("b", 9.0, 2.0, 5), ("d", 1.0, 2.0, 0)]))
+    added, updated, removed = diff_planes(before, after)
+    assert list(added.index) == ["d"]
+    assert list(updated.index) == ["b"]
+    assert removed == ["c"]
+
+
+def test_diff_planes_treats_missing_values_as_equal():
+    df = snapshot([("a", 1.0, 2.0, 0)])
+    df["true_track"] = float("nan")
+    planes = project_planes(df)
+    added, updated, removed = diff_planes(planes, planes.copy())
+    assert added.empty and updated.empty and removed == []
+
+
+def test_payload_sends_a_full_snapshot_then_deltas():
+    feed = PlaneFeed()
+    first = feed.payload(snapshot([("a", 1.0, 2.0, 0), ("b", 1.0, 2.0, 0)]), "v1")
+    assert first["mode"] == "full"
+    assert {plane["icao24"] for plane in first["added"]} == {"a", "b"}
+
+    second = feed.payload(snapshot([("a", 2.0, 2.0, 5), ("c", 1.0, 2.0, 5)]), "v2", client_version="v1")
+    assert second["mode"] == "delta"
+    assert second["base_version"] == "v1"
+    assert [plane["icao24"] for plane in second["added"]] == ["c"]
+    assert [plane["icao24"] for plane in second["updated"]] == ["a"]
+    assert second["removed"] == ["b"]
+    assert second["count"] == 2
+
+
+def test_payload_falls_back_to_full_for_unknown_versions():
+    feed = PlaneFeed(history=1)
+    feed.payload(snapshot([("a", 1.0, 2.0, 0)]), "v1")
+    feed.payload(snapshot([("a", 1.0, 2.0, 0)]), "v2")
+    update = feed.payload(snapshot([("a", 1.0, 2.0, 0)]), "v3", client_version="v1")
+    assert update["mode"] == "full"
+
+
+def test_payload_is_empty_for_a_client_that_is_up_to_date():
+    feed = PlaneFeed()
+    df = snapshot([("a", 1.0, 2.0, 0)])
+    feed.payload(df, "v1")
+    update = feed.payload(df, "v1", client_version="v1")
+    assert update["mode"] == "delta"
+    assert update["added"] == [] and update["updated"] == [] and update["removed"] == []
+
+
+def test_json_records_send_missing_values_as_null():
+    df = snapshot([("a", 1.0, 2.0, 0)])
+    df["callsign"] = None
+    update = PlaneFeed().payload(df, "v1")
+    assert update["added"][0]["callsign"] is None
+    assert update["added"][0]["time_position"].startswith("2024-05-01T12:00:00")
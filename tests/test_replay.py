@@ -0,0 +1,171 @@
+import base64
+import threading
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+from utils.replay import ReplayService, register_replay_routes, split_snapshots
+from utils.wire import decode_planes
+
+T0 = pd.Timestamp("2024-05-01 12:00:00", tz="UTC")
+
+
+def snapshot_rows(seconds, planes):
+    """planes: {icao24: longitude}; positions keep their report time so unmoved planes stay unchanged."""
+    return pd.DataFrame({
+        "ingest_time": [T0 + pd.Timedelta(seconds=seconds)] * len(planes),
+        "time_position": [T0] * len(planes),
+        "icao24": list(planes),
+        "callsign": [f"CS{icao}" for icao in planes],
+        "origin_country": ["Germany"] * len(planes),
+        "longitude": list(planes.values()),
+        "latitude": [47.0] * len(planes),
+        "velocity": [200.0] * len(planes),
+        "true_track": [90.0] * len(planes)
+    })
+
+
+SNAPSHOTS = [
+    (0, {"a": 1.0, "b": 2.0}),
+    (10, {"a": 1.5, "b": 2.0, "c": 3.0}),
+    (20, {"a": 2.0, "c": 3.0})
+]
+
+
+def history():
+    # Rows arrive in no particular order
+    return pd.concat([snapshot_rows(*s) for s in reversed(SNAPSHOTS)], ignore_index=True)
+
+
+def apply(state, frame):
+    if frame["mode"] == "full":
+        state = {}
+    for icao in frame["removed"]:
+        state.pop(icao, None)
+    planes = decode_planes(base64.b64decode(frame["planes"]))
+    for row in planes.itertuples():
+        state[row.icao24] = row.longitude
+    return state
+
+
+def test_split_snapshots_plays_back_every_snapshot():
+    frames = split_snapshots(history())
+    assert [frame["mode"] for frame in frames] == ["full", "delta", "delta"]
+    assert [frame["time"] for frame in frames] == [(T0 + pd.Timedelta(seconds=s)).timestamp() for s, _ in SNAPSHOTS]
+    assert frames[1]["base_version"] == frames[0]["version"]
+
+    state = {}
+    for frame, (_, planes) in zip(frames, SNAPSHOTS):
+        state = apply(state, frame)
+        assert state == planes
+        assert frame["count"] == len(planes)
+
+
+def test_deltas_only_carry_changed_planes():
+    frames = split_snapshots(history())
+    changed = decode_planes(base64.b64decode(frames[2]["planes"]))
+    assert changed["icao24"].tolist() == ["a"]
+    assert frames[2]["removed"] == ["b"]
+
+
+def test_split_snapshots_without_rows():
+    assert split_snapshots(None) == []
+    assert split_snapshots(pd.DataFrame()) == []
+
+
+class FakeHistory:
+
+    def __init__(self, last=10_000):
+        self.last = last
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def fetch_range(self, start, end, country):
+        self.calls.append((start, end, country))
+        self.release.wait(5)
+        return snapshot_rows(start - T0.timestamp(), {"a": 1.0})
+
+    def fetch_extent(self):
+        return (0, self.last)
+
+
+def test_windows_are_aligned_and_cached():
+    source = FakeHistory()
+    service = ReplayService(source.fetch_range, source.fetch_extent, window_seconds=300)
+    window = service.window(1234, prefetch=False)
+    assert (window["start"], window["end"]) == (1200, 1500)
+    assert window["complete"]
+    service.window(1499, prefetch=False)
+    assert source.calls == [(1200, 1500, None)]
+    assert service.stats()["hits"] == 1
+
+
+def test_windows_past_the_newest_snapshot_are_not_cached():
+    source = FakeHistory(last=1300)
+    service = ReplayService(source.fetch_range, source.fetch_extent, window_seconds=300)
+    assert not service.window(1234, prefetch=False)["complete"]
+    service.window(1234, prefetch=False)
+    assert len(source.calls) == 2
+
+
+def test_concurrent_requests_share_one_load():
+    source = FakeHistory()
+    source.release.clear()
+    service = ReplayService(source.fetch_range, source.fetch_extent, window_seconds=300)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.window(600, prefetch=False)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    source.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(source.calls) == 1
+    assert len(results) == 5
+
+
+def test_serving_a_window_prefetches_the_next():
+    source = FakeHistory()
+    service = ReplayService(source.fetch_range, source.fetch_extent, window_seconds=300)
+    service.window(0)
+    for _ in range(100):
+        if service.stats()["windows"] == 2:
+            break
+        threading.Event().wait(0.01)
+    assert (300, 600, None) in source.calls
+
+
+@pytest.fixture
+def client():
+    source = FakeHistory()
+
+    def fetch_range(start, end, country):
+        if start >= 9000:
+            raise RuntimeError("warehouse down")
+        return source.fetch_range(start, end, country)
+
+    server = Flask(__name__)
+    register_replay_routes(server, ReplayService(fetch_range, source.fetch_extent, window_seconds=300))
+    return server.test_client()
+
+
+def test_window_route(client):
+    response = client.get("/api/replay/window?start=1234")
+    assert response.status_code == 200
+    assert response.get_json()["start"] == 1200
+    assert response.headers["Cache-Control"] == "public, max-age=3600"
+    assert client.get("/api/replay/extent").get_json() == {"start": 0, "end": 10_000, "window_seconds": 300}
+
+
+@pytest.mark.parametrize("start", ["", "abc", "nan", "inf", "-inf"])
+def test_window_route_rejects_bad_starts(client, start):
+    assert client.get(f"/api/replay/window?start={start}").status_code == 400
+    assert client.get("/api/replay/window").status_code == 400
+
+
+def test_window_route_reports_warehouse_errors(client):
+    response = client.get("/api/replay/window?start=9100")
+    assert response.status_code == 503
+    assert "error" in response.get_json()
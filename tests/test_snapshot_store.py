@@ -0,0 +1,108 @@
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from utils import snapshot_store
+from utils.snapshot_store import SnapshotStore, fingerprint, fingerprints_match
+
+PROJECTED = ("all_flights", ("longitude", "latitude"), ())
+
+
+def flights():
+    return pd.DataFrame({
+        "icao24": ["a", "b"],
+        "longitude": [8.5, 9.0],
+        "latitude": [47.4, None],
+        "on_ground": [True, False],
+        "time_position": pd.to_datetime(["2024-05-01 12:00", "2024-05-01 12:01"], utc=True)
+    })
+
+
+def store(directory, **kwargs):
+    return SnapshotStore(str(directory), source="c.s", save_seconds=0, **kwargs)
+
+
+def test_round_trip(tmp_path):
+    writer = store(tmp_path)
+    assert writer.save("latest_flights", flights(), version=123)
+    assert writer.save(PROJECTED, flights()[["longitude", "latitude"]])
+
+    snapshots = {key: (version, stored, df) for key, version, stored, df in store(tmp_path).load_all()}
+    assert set(snapshots) == {"latest_flights", PROJECTED}
+    version, stored, df = snapshots["latest_flights"]
+    assert version == "123"
+    pd.testing.assert_frame_equal(df, flights())
+    assert stored == fingerprint(flights())
+
+
+@pytest.mark.parametrize("reader", [
+    lambda directory: SnapshotStore(str(directory), source="other.schema"),
+    lambda directory: SnapshotStore(str(directory), source="c.s", max_age_seconds=-1)
+])
+def test_files_for_another_source_or_too_old_are_rejected_and_removed(tmp_path, reader):
+    store(tmp_path).save("latest_flights", flights())
+    assert reader(tmp_path).load_all() == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_files_from_another_format_are_rejected(tmp_path, monkeypatch):
+    store(tmp_path).save("latest_flights", flights())
+    monkeypatch.setattr(snapshot_store, "SNAPSHOT_FORMAT", snapshot_store.SNAPSHOT_FORMAT + 1)
+    assert store(tmp_path).load_all() == []
+
+
+def test_projections_whose_columns_differ_from_their_key_are_rejected(tmp_path):
+    store(tmp_path).save(PROJECTED, flights()[["latitude", "longitude"]])
+    assert store(tmp_path).load_all() == []
+
+
+def test_unreadable_files_are_rejected(tmp_path):
+    (tmp_path / "all_flights-0000000000000000.arrow").write_bytes(b"not arrow")
+    assert store(tmp_path).load_all() == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_saves_are_throttled_per_key(tmp_path):
+    throttled = SnapshotStore(str(tmp_path), source="c.s", save_seconds=60)
+    assert throttled.save("a", flights())
+    assert not throttled.save("a", flights())
+    assert throttled.save("b", flights())
+    assert throttled.save("a", flights(), force=True)
+
+
+def test_save_later_writes_the_newest_frame(tmp_path):
+    writer = store(tmp_path)
+    for i in range(5):
+        writer.save_later("latest_flights", flights().assign(longitude=float(i)))
+    assert writer.flush(5)
+    [(_, _, _, df)] = store(tmp_path).load_all()
+    assert df["longitude"].tolist() == [4.0, 4.0]
+
+
+def test_discard(tmp_path):
+    writer = store(tmp_path)
+    writer.save("latest_flights", flights())
+    writer.discard("latest_flights")
+    writer.discard("latest_flights")
+    assert os.listdir(tmp_path) == []
+
+
+def test_fingerprints_compare_names_and_coarse_kinds():
+    stored = fingerprint(flights())
+    assert dict(stored)["time_position"] == "time"
+    assert dict(stored)["latitude"] == "number"
+
+    # Integers with nulls turning into floats still match
+    assert fingerprints_match(fingerprint(pd.DataFrame({"n": [1, 2]})), fingerprint(pd.DataFrame({"n": [1.0, None]})))
+    assert not fingerprints_match(stored, fingerprint(flights().assign(on_ground=["yes", "no"])))
+    assert not fingerprints_match(stored, fingerprint(flights().drop(columns="latitude")))
+    assert not fingerprints_match(stored, fingerprint(flights()[list(reversed(flights().columns))]))
+
+
+def test_empty_probe_columns_match_any_kind():
+    # A LIMIT 0 probe fetched without Arrow has untyped, empty columns
+    probe = pd.DataFrame(columns=list(flights().columns))
+    assert fingerprints_match(fingerprint(flights()), fingerprint(probe))
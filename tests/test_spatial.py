@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from utils.spatial import GridIndex, viewport_bounds
+
+
+def brute_force(lon, lat, bounds):
+    min_lon, min_lat, max_lon, max_lat = bounds
+    lat_inside = (lat >= min_lat) & (lat <= max_lat)
+    if max_lon > 180:
+        lon_inside = (lon >= min_lon) | (lon <= max_lon - 360)
+    else:
+        lon_inside = (lon >= min_lon) & (lon <= max_lon)
+    return np.flatnonzero(lon_inside & lat_inside)
+
+
+@pytest.fixture(scope="module")
+def positions():
+    rng = np.random.default_rng(11)
+    lon = rng.uniform(-180, 180, 5000)
+    lat = rng.uniform(-90, 90, 5000)
+    lon[:10] = np.nan
+    lat[10:20] = np.nan
+    # Exactly on cell borders and the edges of the world
+    lon[20:25] = [-180.0, 180.0, 0.0, 10.0, 179.5]
+    lat[20:25] = [-90.0, 90.0, 0.0, 47.0, 0.0]
+    return lon, lat
+
+
+@pytest.mark.parametrize("cell_degrees", [0.5, 1.0, 7.0])
+@pytest.mark.parametrize("bounds", [
+    (5.0, 45.0, 15.0, 55.0),
+    (10.0, 47.0, 10.0, 47.0),
+    (-180.0, -90.0, 180.0, 90.0),
+    (-3.3, -12.7, 41.9, 0.2),
+    (170.0, -10.0, 190.0, 10.0),
+    (179.0, -5.0, 181.0, 5.0),
+    (20.0, 60.0, 10.0, 70.0)
+])
+def test_query_matches_brute_force(positions, cell_degrees, bounds):
+    lon, lat = positions
+    index = GridIndex(lon, lat, cell_degrees=cell_degrees)
+    np.testing.assert_array_equal(index.query(bounds), brute_force(lon, lat, bounds))
+
+
+def test_antimeridian_box_finds_both_sides():
+    index = GridIndex([179.5, -179.5, 0.0], [0.0, 0.0, 0.0])
+    assert index.query((179.0, -1.0, 181.0, 1.0)).tolist() == [0, 1]
+
+
+def test_empty_index():
+    index = GridIndex([], [])
+    assert index.query((0, 0, 10, 10)).tolist() == []
+
+
+def test_viewport_bounds_pads_and_snaps():
+    bounds = viewport_bounds({"extent": [8.1, 46.2, 9.9, 47.8], "zoom": 8})
+    min_lon, min_lat, max_lon, max_lat = bounds
+    assert min_lon <= 8.1 - 0.45 and max_lon >= 9.9 + 0.45
+    assert min_lat <= 46.2 - 0.4 and max_lat >= 47.8 + 0.4
+    # A small pan keeps the same box
+    assert viewport_bounds({"extent": [8.15, 46.25, 9.95, 47.85], "zoom": 8}) == bounds
+
+
+def test_viewport_bounds_across_the_antimeridian():
+    min_lon, _, max_lon, _ = viewport_bounds({"extent": [175.0, -5.0, 185.0, 5.0]})
+    assert -180 <= min_lon < 180
+    assert max_lon > 180
+
+
+@pytest.mark.parametrize("viewport", [
+    None,
+    {},
+    {"extent": None},
+    {"extent": [10, 10, 10, 20]},
+    {"extent": [-180, -80, 180, 80]}
+])
+def test_viewport_bounds_without_a_usable_box(viewport):
+    assert viewport_bounds(viewport) is None
@@ -0,0 +1,127 @@
+import math
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+
+from utils.tiles import (
+    EMPTY_TILE, GRID_SIZE, DensityPyramid, DensityTileService, encode_png, morton, register_tile_routes
+)
+
+
+def random_positions(n=2000, seed=3):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-180, 180, n), rng.uniform(-80, 80, n)
+
+
+def cell_of(lon, lat, z):
+    """Brute-force density cell (tile x, tile y, grid x, grid y) of a position at zoom z."""
+    scale = (1 << z) * GRID_SIZE
+    x = (lon + 180.0) / 360.0 * scale
+    y = (1.0 - math.log(math.tan(math.radians(lat)) + 1.0 / math.cos(math.radians(lat))) / math.pi) / 2.0 * scale
+    x, y = min(int(x), scale - 1), min(int(y), scale - 1)
+    return x // GRID_SIZE, y // GRID_SIZE, x % GRID_SIZE, y % GRID_SIZE
+
+
+def test_morton_interleaves_bits():
+    assert morton(np.uint64(0b11), np.uint64(0b00)) == 0b0101
+    assert morton(np.uint64(0b00), np.uint64(0b11)) == 0b1010
+    assert morton(np.uint64(5), np.uint64(9)) == 0b10010011
+
+
+@pytest.mark.parametrize("z", [0, 1, 3])
+def test_grids_match_brute_force_counts(z):
+    lon, lat = random_positions()
+    pyramid = DensityPyramid(lon, lat, max_zoom=6)
+    expected = {}
+    for a, b in zip(lon, lat):
+        tx, ty, gx, gy = cell_of(a, b, z)
+        expected.setdefault((tx, ty), np.zeros((GRID_SIZE, GRID_SIZE), dtype=int))[gy, gx] += 1
+
+    for x in range(1 << z):
+        for y in range(1 << z):
+            grid = pyramid.grid(z, x, y)
+            np.testing.assert_array_equal(grid, expected.get((x, y), np.zeros_like(grid)))
+
+
+def test_every_aircraft_is_counted_once_per_zoom():
+    lon, lat = random_positions()
+    pyramid = DensityPyramid(lon, lat, max_zoom=4)
+    for z in range(3):
+        total = sum(pyramid.grid(z, x, y).sum() for x in range(1 << z) for y in range(1 << z))
+        assert total == len(lon)
+
+
+def test_invalid_positions_are_dropped():
+    pyramid = DensityPyramid([10.0, np.nan, 200.0, 10.0], [50.0, 50.0, 50.0, np.nan])
+    assert len(pyramid) == 1
+
+
+def test_peak_is_the_largest_cell_of_the_zoom():
+    lon, lat = random_positions()
+    lon[:50], lat[:50] = 8.5, 47.4
+    pyramid = DensityPyramid(lon, lat, max_zoom=4)
+    for z in range(3):
+        largest = max(pyramid.grid(z, x, y).max() for x in range(1 << z) for y in range(1 << z))
+        assert pyramid.peak(z) == largest
+
+
+def test_png_encoding_is_valid():
+    rgba = np.zeros((4, 3, 4), dtype=np.uint8)
+    rgba[1, 2] = [255, 0, 0, 255]
+    png = encode_png(rgba)
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    width, height = struct.unpack(">II", png[16:24])
+    assert (width, height) == (3, 4)
+    idat_length = struct.unpack(">I", png[33:37])[0]
+    raw = zlib.decompress(png[41:41 + idat_length])
+    assert len(raw) == 4 * (3 * 4 + 1)
+
+
+def test_empty_tiles_share_one_png():
+    pyramid = DensityPyramid([8.5], [47.4], max_zoom=4)
+    assert pyramid.tile(4, 0, 0) is EMPTY_TILE
+    assert pyramid.tile(4, 8, 5) is not EMPTY_TILE
+
+
+def flights(lon, lat):
+    return pd.DataFrame({"longitude": lon, "latitude": lat})
+
+
+def test_service_versions_follow_the_source_and_survive_failed_loads():
+    source = [flights([8.5], [47.4])]
+    service = DensityTileService(lambda: source[0], max_zoom=4)
+    version, pyramid = service.current()
+    assert version == 1 and len(pyramid) == 1
+
+    for failed in (None, pd.DataFrame()):
+        source[0] = failed
+        assert service.current() == (version, pyramid)
+
+    source[0] = flights([8.5, 9.0], [47.4, 48.0])
+    assert service.current()[0] == 2
+
+
+def test_service_caches_tiles_per_version():
+    frame = flights([8.5], [47.4])
+    service = DensityTileService(lambda: frame, max_zoom=4)
+    assert service.tile(5, 0, 0) is None
+    first = service.tile(2, 2, 1)
+    assert service.tile(2, 2, 1) == first
+    assert service.stats()["hits"] == 1
+
+
+def test_only_the_served_version_is_cached_by_browsers():
+    frame = flights([8.5], [47.4])
+    server = Flask(__name__)
+    register_tile_routes(server, DensityTileService(lambda: frame, max_zoom=4))
+    client = server.test_client()
+
+    version = client.get("/tiles/density/version").get_json()["version"]
+    assert client.get(f"/tiles/density/2/2/1.png?v={version}").headers["Cache-Control"] == "public, max-age=300"
+    assert client.get(f"/tiles/density/2/2/1.png?v={version + 1}").headers["Cache-Control"] == "no-cache"
+    assert client.get("/tiles/density/2/2/1.png").headers["Cache-Control"] == "no-cache"
+    assert client.get("/tiles/density/9/0/0.png").status_code == 404
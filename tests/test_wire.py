@@ -0,0 +1,56 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.wire import decode_planes, encode_planes, encode_planes_base64
+
+
+def planes(n):
+    return pd.DataFrame({
+        "icao24": [f"{i:06x}" for i in range(n)],
+        "callsign": [f"DLH{i}" if i % 3 else None for i in range(n)],
+        "origin_country": ["Germany" if i % 2 else "Österreich" for i in range(n)],
+        "longitude": np.linspace(-180, 180, n),
+        "latitude": np.linspace(-85, 85, n),
+        "velocity": [np.nan if i % 5 == 0 else 200.5 for i in range(n)],
+        "true_track": np.linspace(0, 359, n),
+        "time_position": pd.date_range("2024-05-01 12:00", periods=n, freq="s", tz="UTC")
+    }).set_index("icao24")
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 100])
+def test_round_trip(n):
+    original = planes(n).reset_index()
+    decoded = decode_planes(encode_planes(planes(n)))
+
+    assert len(decoded) == n
+    for column in ["icao24", "callsign", "origin_country"]:
+        assert decoded[column].tolist() == original[column].tolist()
+    for column in ["longitude", "latitude", "velocity", "true_track"]:
+        np.testing.assert_allclose(decoded[column], original[column].astype(np.float32), equal_nan=True)
+    assert (decoded["time_position"] == original["time_position"]).all()
+
+
+def test_repeated_strings_are_stored_once():
+    encoded = encode_planes(planes(100))
+    assert encoded.count("Germany".encode("utf-8")) == 1
+
+
+def test_missing_columns_decode_as_missing_values():
+    df = pd.DataFrame({"icao24": ["abc123"], "longitude": [1.5], "latitude": [2.5]})
+    decoded = decode_planes(encode_planes(df))
+    assert decoded["callsign"].tolist() == [None]
+    assert np.isnan(decoded["velocity"].iloc[0])
+    assert decoded["time_position"].isna().all()
+
+
+def test_base64_matches_the_binary_encoding():
+    df = planes(10)
+    assert base64.b64decode(encode_planes_base64(df)) == encode_planes(df)
+
+
+def test_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode_planes(b"JUNK" + b"\0" * 12)
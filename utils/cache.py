@@ -0,0 +1,186 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def _estimate_size(data):
+    """Approximate memory footprint of a cached value in bytes, including the strings in object columns."""
+    if hasattr(data, 'memory_usage'):
+        try:
+            return int(data.memory_usage(index=True, deep=True).sum())
+        except Exception:
+            pass
+    if isinstance(data, dict):
+        return sys.getsizeof(data) + sum(_estimate_size(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return sys.getsizeof(data) + sum(_estimate_size(value) for value in data)
+    return sys.getsizeof(data)
+
+
+class _Flight:
+    """A query in progress that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class QueryCache:
+    """
+    Thread-safe TTL cache with request coalescing.
+
+    Concurrent misses for the same key share one in-flight load instead of
+    each hitting the warehouse. Entries that are past their TTL but still
+    inside the stale window are returned immediately while a single
+    background refresh runs, as are warm entries restored from disk until
+    their first refresh. Least recently used entries are evicted once
+    max_entries or max_bytes is exceeded. on_store(key, data) is called after
+    every successful load.
+    """
+
+    def __init__(self, ttls=None, default_ttl=0, stale_seconds=0, max_entries=64, max_bytes=512 * 1024 * 1024,
+                 on_store=None):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_store = on_store
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> {'data', 'fetched_at', 'size', 'warm'}
+        self._flights = {}              # key -> _Flight
+        self._requested = {}            # key -> monotonic time of the last get()
+        self._bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def ttl_for(self, table_name):
+        return self.ttls.get(table_name, self.default_ttl)
+
+    def get(self, key, loader, ttl):
+        """
+        Return the cached value for key, calling loader() at most once across
+        concurrent callers when the entry is missing or expired.
+        """
+        with self._lock:
+            self._requested[key] = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and ttl > 0:
+                age = time.monotonic() - entry['fetched_at']
+                if age < ttl and not entry['warm']:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry['data']
+                if age < ttl + self.stale_seconds or entry['warm']:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._flights:
+                        self._flights[key] = _Flight()
+                        threading.Thread(target=self._load, args=(key, loader, ttl),
+                                         daemon=True, name=f"cache-refresh-{key}").start()
+                    return entry['data']
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+
+        if leader:
+            self._load(key, loader, ttl)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.data
+
+    def refresh(self, key, loader, ttl):
+        """
+        Load key now and store the result, unless a load for it is already
+        in flight. Returns True if this call performed the load; an error
+        raised by loader is raised again.
+        """
+        with self._lock:
+            if key in self._flights:
+                return False
+            flight = self._flights[key] = _Flight()
+        self._load(key, loader, ttl)
+        if flight.error is not None:
+            raise flight.error
+        return True
+
+    def last_requested(self, key):
+        """Monotonic time of the last get() for key, or None if never requested."""
+        with self._lock:
+            return self._requested.get(key)
+
+    def _load(self, key, loader, ttl):
+        with self._lock:
+            flight = self._flights[key]
+        try:
+            flight.data = loader()
+        except Exception as e:
+            flight.error = e
+        # Measured before taking the lock; a deep estimate visits every string
+        size = _estimate_size(flight.data) if flight.error is None and flight.data is not None and ttl > 0 else 0
+        stored = False
+        with self._lock:
+            if flight.error is None and flight.data is not None and ttl > 0:
+                self._store(key, flight.data, size)
+                stored = True
+            del self._flights[key]
+        flight.done.set()
+        if stored and self.on_store is not None:
+            try:
+                self.on_store(key, flight.data)
+            except Exception as e:
+                print(f"[Cache] on_store for {key} failed: {str(e)}")
+
+    def _store(self, key, data, size, warm=False):
+        """Insert an entry of size bytes and evict LRU entries. Caller must hold the lock."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old['size']
+        self._entries[key] = {'data': data, 'fetched_at': time.monotonic(), 'size': size, 'warm': warm}
+        self._bytes += size
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted['size']
+
+    def put(self, key, data):
+        size = _estimate_size(data)
+        with self._lock:
+            self._store(key, data, size)
+
+    def warm(self, key, data):
+        """
+        Insert data restored from a previous run. It is served right away,
+        and the first get() also starts a background reload.
+        """
+        size = _estimate_size(data)
+        with self._lock:
+            if key not in self._entries:
+                self._store(key, data, size, warm=True)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= entry['size']
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "in_flight": len(self._flights)
+            }
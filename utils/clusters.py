@@ -0,0 +1,87 @@
+"""
+Level-of-detail clustering for the live map.
+
+Below a configurable zoom the map shows clustered counts instead of single
+aircraft. Clusters are computed on the server once per snapshot for a few
+fixed zoom tiers by bucketing Web Mercator positions into cells of
+cell_pixels screen pixels at each tier. Each request then only selects the
+tier matching the map's zoom and the clusters inside its viewport.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_LATITUDE = 85.05112878
+
+
+def cluster_planes(df, tiers, cell_pixels=64):
+    """
+    Return {tier: (n, 3) array of longitude, latitude, count} for the
+    aircraft in df, with the mean position of each cluster.
+    """
+    lon = df['longitude'].to_numpy(dtype=float, na_value=np.nan) if 'longitude' in df.columns else np.empty(0)
+    lat = df['latitude'].to_numpy(dtype=float, na_value=np.nan) if 'latitude' in df.columns else np.empty(0)
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    lon = lon[valid]
+    lat = lat[valid]
+
+    # Web Mercator position in [0, 1), y growing southwards
+    x = (lon + 180.0) / 360.0
+    lat_rad = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+
+    clusters = {}
+    for tier in tiers:
+        cells_per_side = max(1, int((1 << tier) * 256 / cell_pixels))
+        cx = np.clip((x * cells_per_side).astype(np.int64), 0, cells_per_side - 1)
+        cy = np.clip((y * cells_per_side).astype(np.int64), 0, cells_per_side - 1)
+        _, cell, counts = np.unique(cy * cells_per_side + cx, return_inverse=True, return_counts=True)
+        mean_lon = np.bincount(cell, weights=lon, minlength=len(counts)) / counts
+        mean_lat = np.bincount(cell, weights=lat, minlength=len(counts)) / counts
+        clusters[tier] = np.column_stack([mean_lon, mean_lat, counts])
+    return clusters
+
+
+def clusters_in_view(clusters, zoom, bounds=None):
+    """
+    Pick the tier closest to (not above) zoom and return it as
+    {tier: [[longitude, latitude, count], ...]} for JSON, keeping only the
+    clusters inside bounds (min_lon, min_lat, max_lon, max_lat) if given.
+    """
+    if not clusters:
+        return {}
+    tiers = sorted(clusters)
+    tier = max([t for t in tiers if t <= zoom], default=tiers[0])
+    rows = clusters[tier]
+    if bounds is not None and len(rows):
+        min_lon, min_lat, max_lon, max_lat = bounds
+        lon = rows[:, 0]
+        # max_lon beyond 180 means the box crosses the antimeridian
+        in_lon = (lon >= min_lon) & (lon <= max_lon) | (lon <= max_lon - 360)
+        rows = rows[in_lon & (rows[:, 1] >= min_lat) & (rows[:, 1] <= max_lat)]
+    return {str(tier): [[round(lon, 4), round(lat, 4), int(count)] for lon, lat, count in rows.tolist()]}
+
+
+class SnapshotClusters:
+    """Clusters of the last few snapshot versions, computed once per version."""
+
+    def __init__(self, tiers=(2, 3, 4, 5), cell_pixels=64, history=8):
+        self.tiers = tuple(tiers)
+        self.cell_pixels = cell_pixels
+        self.history = history
+        self._lock = threading.Lock()
+        self._clusters = OrderedDict()   # version -> clusters
+
+    def get(self, version, df):
+        with self._lock:
+            clusters = self._clusters.get(version)
+            if clusters is not None:
+                self._clusters.move_to_end(version)
+                return clusters
+        clusters = cluster_planes(df, self.tiers, self.cell_pixels)
+        with self._lock:
+            self._clusters[version] = clusters
+            while len(self._clusters) > self.history:
+                self._clusters.popitem(last=False)
+        return clusters
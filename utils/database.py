@@ -6,7 +6,23 @@ from datetime import datetime
 import dash
 import numpy as np
 import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
 import yaml
+from utils.cache import QueryCache
+from utils.spatial import GridIndex
+from utils.trajectories import TrajectoryStore
+from utils.fleet_series import FleetTimeSeries
+from utils.flight_stats import compute_flight_stats, flight_stats_queries, parse_flight_stats
+
+try:
+    import pyarrow
+    from utils.snapshot_store import SnapshotStore, fingerprint, fingerprints_match
+except ImportError:  # Row-based fetching is used and no snapshots are kept on disk when pyarrow is unavailable
+    pyarrow = None
+    SnapshotStore = None
 
 # Load config from YAML file once at module load
 def load_config(path="config.yaml"):
@@ -15,7 +31,7 @@ def load_config(path="config.yaml"):
 
 config = load_config()
 
-def get_connection():
+def _open_connection():
     try:
         return sql.connect(
             server_hostname=config["db_host"],
@@ -28,17 +44,269 @@ def get_connection():
         print(f"Error creating Databricks connection: {str(e)}")
         raise
 
-def _query_table(table_name):
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of long-lived Databricks SQL connections.
+    Idle connections are health-checked before reuse and closed once they
+    have been idle for longer than idle_timeout seconds.
+    """
+
+    def __init__(self, max_size=4, idle_timeout=300, health_check_after=30, acquire_timeout=30):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle = []          # list of (connection, last_used) tuples, most recent last
+        self._open_count = 0     # idle + borrowed connections
+        self._stats = {
+            "sessions_opened": 0,
+            "sessions_closed": 0,
+            "borrows": 0,
+            "health_check_failures": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0
+        }
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception as e:
+            print(f"[Pool] Error closing connection: {str(e)}")
+        with self._cond:
+            self._open_count -= 1
+            self._stats["sessions_closed"] += 1
+            self._cond.notify()
+
+    def _evict_idle(self):
+        """Remove connections idle for too long. Caller must hold the lock."""
+        now = time.monotonic()
+        expired = [c for c, last_used in self._idle if now - last_used > self.idle_timeout]
+        self._idle = [(c, t) for c, t in self._idle if now - t <= self.idle_timeout]
+        return expired
+
+    def _is_healthy(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            return True
+        except Exception as e:
+            print(f"[Pool] Health check failed: {str(e)}")
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def acquire(self):
+        start = time.monotonic()
+        while True:
+            connection = None
+            last_used = None
+            with self._cond:
+                expired = self._evict_idle()
+                while not self._idle and self._open_count >= self.max_size:
+                    remaining = self.acquire_timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        raise TimeoutError(f"Timed out waiting {self.acquire_timeout}s for a database connection")
+                    self._cond.wait(remaining)
+                    expired += self._evict_idle()
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                else:
+                    self._open_count += 1
+            for c in expired:
+                self._close(c)
+
+            if connection is None:
+                try:
+                    connection = _open_connection()
+                except Exception:
+                    with self._cond:
+                        self._open_count -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["sessions_opened"] += 1
+            elif time.monotonic() - last_used > self.health_check_after and not self._is_healthy(connection):
+                self._close(connection)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._stats["borrows"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return connection
+
+    def release(self, connection, discard=False):
+        if discard:
+            self._close(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception:
+            # The session may be broken; never hand it to another caller
+            self.release(connection, discard=True)
+            raise
+        else:
+            self.release(connection)
+
+    def close_all(self):
+        with self._cond:
+            idle = [c for c, _ in self._idle]
+            self._idle = []
+        for c in idle:
+            self._close(c)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["open"] = self._open_count
+            stats["idle"] = len(self._idle)
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["borrows"] if stats["borrows"] else 0.0
+        return stats
+
+_pool = ConnectionPool(
+    max_size=config.get("db_pool_size", 4),
+    idle_timeout=config.get("db_pool_idle_seconds", 300),
+    health_check_after=config.get("db_pool_health_check_seconds", 30),
+    acquire_timeout=config.get("db_pool_timeout_seconds", 30)
+)
+
+def get_connection():
+    """
+    Borrow a pooled connection. Use as a context manager:
+
+        with get_connection() as connection:
+            ...
     """
-    Query a table directly from the database.
+    return _pool.connection()
+
+def get_pool_stats():
+    """Return pool counters (sessions opened/closed, borrow wait times)."""
+    return _pool.stats()
+
+def _fetch_dataframe(cursor):
+    """
+    Build a DataFrame from an executed cursor.
+    Uses the columnar Arrow path when available, so no per-row Python objects
+    are created and timestamps arrive already typed. Falls back to fetchall()
+    only when the Arrow fetch itself fails, since it consumes the result set.
+    """
+    if pyarrow is not None and config.get("db_use_arrow", True) and hasattr(cursor, "fetchall_arrow"):
+        try:
+            table = cursor.fetchall_arrow()
+        except Exception as e:
+            print(f"[Arrow] Columnar fetch failed ({str(e)}), falling back to row fetch")
+        else:
+            # Not self_destruct: the table must stay usable if the conversion fails
+            try:
+                return table.to_pandas(split_blocks=True)
+            except Exception as e:
+                print(f"[Arrow] Conversion to pandas failed ({str(e)}), converting row by row")
+                return pd.DataFrame(table.to_pylist(), columns=table.column_names)
+    result = cursor.fetchall()
+    return pd.DataFrame(result, columns=[col[0] for col in cursor.description])
+
+def _execute_query(query, parameters=None, retries=1):
+    """
+    Run a query on a pooled connection and return the result as a DataFrame.
+    parameters are bound by the connector for %(name)s markers in query.
+    A failed attempt discards its connection and is retried on a fresh one.
+    """
+    for attempt in range(retries + 1):
+        try:
+            with get_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(query, parameters)
+                    return _fetch_dataframe(cursor)
+        except (KeyError, RuntimeError, TimeoutError):
+            raise
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            print(f"[Pool] Query failed ({str(e)}), reconnecting and retrying")
+
+def _to_utc(series):
+    """Return series as UTC-aware datetimes; a no-op when Arrow already delivered UTC."""
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        return pd.to_datetime(series, utc=True)
+    if series.dt.tz is None:
+        return series.dt.tz_localize('UTC')
+    if str(series.dt.tz) in ('UTC', 'Etc/UTC'):
+        return series
+    return series.dt.tz_convert('UTC')
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_FILTER_OPERATORS = {"=", "!=", "<", "<=", ">", ">=", "in", "is null", "is not null"}
+
+def _quote_identifier(name):
+    if not isinstance(name, str) or not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name!r}")
+    return f"`{name}`"
+
+def _normalize_filters(filters):
+    """
+    Turn filters into a tuple of (column, operator, value) triples.
+    A dict means equality on every key; a list holds (column, operator, value)
+    or (column, "is null") entries.
+    """
+    if not filters:
+        return ()
+    items = [(column, "=", value) for column, value in filters.items()] if isinstance(filters, dict) else filters
+    normalized = []
+    for item in items:
+        column, operator, value = (tuple(item) + (None,))[:3]
+        operator = operator.lower()
+        if operator not in _FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {operator!r}")
+        if operator == "in":
+            value = tuple(value)
+        normalized.append((column, operator, value))
+    return tuple(normalized)
+
+def _build_select(table_name, columns=None, filters=()):
+    """Return (query, parameters) selecting columns from table_name with bound filter values."""
+    catalog = config["catalog"]
+    schema = config["schema"]
+    select_list = ", ".join(_quote_identifier(c) for c in columns) if columns else "*"
+    query = f"SELECT {select_list} FROM {catalog}.{schema}.{_quote_identifier(table_name)}"
+
+    conditions = []
+    parameters = {}
+    for i, (column, operator, value) in enumerate(filters):
+        if operator in ("is null", "is not null"):
+            conditions.append(f"{_quote_identifier(column)} {operator.upper()}")
+        elif operator == "in":
+            if not value:
+                conditions.append("FALSE")
+                continue
+            names = [f"p{i}_{j}" for j in range(len(value))]
+            parameters.update(zip(names, value))
+            conditions.append(f"{_quote_identifier(column)} IN ({', '.join(f'%({n})s' for n in names)})")
+        else:
+            parameters[f"p{i}"] = value
+            conditions.append(f"{_quote_identifier(column)} {operator} %(p{i})s")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, parameters or None
+
+def _query_table(table_name, columns=None, filters=()):
+    """
+    Query a table directly from the database, optionally only some columns
+    and rows matching filters (see query_cache).
     This is a helper function that should not generally be called directly.
     Instead, use query_cache which provides caching.
     """
     catalog = config["catalog"]
     schema = config["schema"]
-    host = config["db_host"]
-    token = config["db_token"]
-    http_path = config["db_http_path"]
 
     print(f"[DEBUG] Using catalog: {catalog}, schema: {schema}")
     
@@ -46,88 +314,296 @@ def _query_table(table_name):
 
     
     try:
-        with sql.connect(
-            server_hostname=host,
-            http_path=http_path,
-            access_token=token
-        ) as connection:
-            with connection.cursor() as cursor:
-                query = f"SELECT * FROM {catalog}.{schema}.{table_name}"
-                print(f"[Data Access from {caller}] Executing query: {query}")
-                cursor.execute(query)
-                result = cursor.fetchall()
-                df = pd.DataFrame(result, columns=[col[0] for col in cursor.description])
-                print(f"Query returned {len(df)} rows")
-                return df
+        query, parameters = _build_select(table_name, columns, filters)
+        print(f"[Data Access from {caller}] Executing query: {query} {parameters or ''}")
+        df = _execute_query(query, parameters)
+        print(f"Query returned {len(df)} rows")
+        return df
     except KeyError as e:
         raise RuntimeError(f"Missing required config value: {e.args[0]}")
     except Exception as e:
         print(f"Error in query_table from {caller}: {str(e)}")
         return None
 
-def query_table(table_name):
-    return _query_table(table_name)
+def query_table(table_name, columns=None, filters=None):
+    return _query_table(table_name, columns, _normalize_filters(filters))
 
-def get_latest_flights(selected_country):   # selected_country is a string
+# Per-country row positions for the snapshot currently held in the cache
+_country_index_lock = threading.Lock()
+_country_index = {"data": None, "indices": {}}
+
+def _get_country_indices(df):
+    """Return {origin_country: row positions} for df, built once per snapshot."""
+    with _country_index_lock:
+        if _country_index["data"] is not df:
+            _country_index["indices"] = df.groupby('origin_country', sort=False).indices if 'origin_country' in df.columns else {}
+            _country_index["data"] = df
+        return _country_index["indices"]
+
+# Spatial grid index over the snapshot currently held in the cache
+_spatial_index_lock = threading.Lock()
+_spatial_index = {"data": None, "index": None}
+
+def _get_spatial_index(df):
+    """Return a GridIndex over the positions in df, built once per snapshot."""
+    with _spatial_index_lock:
+        if _spatial_index["data"] is not df:
+            _spatial_index["index"] = GridIndex(
+                df['longitude'].to_numpy(dtype=float, na_value=np.nan),
+                df['latitude'].to_numpy(dtype=float, na_value=np.nan),
+                cell_degrees=config.get("viewport_index_cell_degrees", 1.0)
+            )
+            _spatial_index["data"] = df
+        return _spatial_index["index"]
+
+def get_latest_flights(selected_country, bounds=None):   # selected_country is a string
+    """
+    Return the latest opensky_raw snapshot, optionally for one origin country
+    and only the aircraft inside bounds (min_lon, min_lat, max_lon, max_lat).
+    Every client shares one cached snapshot; country and viewport filters are
+    served from in-memory indexes, so warehouse load does not depend on the
+    selection.
+    """
+    df = _query_cache.get("latest_flights", _load_latest_flights, _query_cache.ttl_for("latest_flights"))
+    if df is None:
+        return pd.DataFrame()
+    return _select_flights(df, selected_country, bounds)
+
+def get_latest_flights_view(selected_country, bounds=None):
+    """
+    Return (flights, in_view) from one cached snapshot: the flights of
+    selected_country and those of them inside bounds (all of them without
+    bounds). Both always describe the same snapshot, even if the cache
+    reloads in between.
+    """
+    df = _query_cache.get("latest_flights", _load_latest_flights, _query_cache.ttl_for("latest_flights"))
+    if df is None:
+        return pd.DataFrame(), pd.DataFrame()
+    flights = _select_flights(df, selected_country)
+    return flights, _select_flights(df, selected_country, bounds) if bounds is not None else flights
+
+def _select_flights(df, selected_country, bounds=None):
+    positions = None
+    if selected_country:
+        positions = _get_country_indices(df).get(selected_country)
+        if positions is None:
+            return df.iloc[0:0]
+    if bounds is not None:
+        inside = _get_spatial_index(df).query(bounds)
+        positions = inside if positions is None else np.intersect1d(positions, inside, assume_unique=True)
+    return df.iloc[positions] if positions is not None else df
+
+# Last snapshot ingested by the incremental fetch, keyed by its timestamp in microseconds
+_snapshot_lock = threading.Lock()
+_snapshot_state = {"ts_micros": None, "data": None, "probes": 0, "fetches": 0}
+
+def _probe_latest_snapshot():
+    """Return MAX(timestamp) of opensky_raw in epoch microseconds, or None if empty."""
+    catalog = config["catalog"]
+    schema = config["schema"]
+    df = _execute_query(f"SELECT unix_micros(MAX(timestamp)) AS ts_micros FROM {catalog}.{schema}.opensky_raw")
+    if df.empty or pd.isna(df['ts_micros'].iloc[0]):
+        return None
+    return int(df['ts_micros'].iloc[0])
+
+# Last positions per aircraft, fed from every latest_flights snapshot
+_trajectories = TrajectoryStore(
+    points=config.get("trail_points", 32),
+    max_aircraft=config.get("trail_max_aircraft", 30000),
+    evict_seconds=config.get("trail_evict_seconds", 600)
+) if config.get("trails", True) else None
+
+def _record_trajectories(df):
+    if _trajectories is not None and df is not None:
+        try:
+            _trajectories.ingest(df)
+        except Exception as e:
+            print(f"[Trails] Error recording trajectories: {str(e)}")
+    return df
+
+# Rolling per-snapshot fleet aggregates for the statistics page trends
+_fleet_series = FleetTimeSeries(
+    window_hours=config.get("fleet_series_hours", 3),
+    max_snapshots=config.get("fleet_series_max_snapshots", 2160),
+    path=config.get("fleet_series_path", "fleet_series.npz"),
+    save_seconds=config.get("fleet_series_save_seconds", 300),
+    climb_rate=config.get('phase_climb_rate', 2.5),
+    descent_rate=config.get('phase_descent_rate', -2.5)
+) if config.get("fleet_series", True) else None
+
+def _record_fleet_series(df):
+    if _fleet_series is not None and df is not None and 'ingest_time' in df.columns:
+        try:
+            timestamp = df['ingest_time'].max()
+            if pd.notna(timestamp):
+                _fleet_series.add(timestamp.timestamp(), df)
+        except Exception as e:
+            print(f"[FleetSeries] Error recording snapshot: {str(e)}")
+    return df
+
+def _record_snapshot(df):
+    """Feed a new latest_flights snapshot to the trails and the fleet series."""
+    _record_fleet_series(df)
+    return _record_trajectories(df)
+
+def get_fleet_series(top_countries=5):
+    """
+    Return (aggregates, countries) DataFrames of the rolling fleet window,
+    see utils.fleet_series; both are empty when the series is disabled.
+    """
+    if _fleet_series is None:
+        return pd.DataFrame(), pd.DataFrame()
+    # Fed by _record_snapshot from the live map and the refresher; never loads a snapshot itself
+    return _fleet_series.frame(), _fleet_series.countries(top_countries)
+
+def get_trails(icao24s, points=None):
+    """Return {icao24: [[longitude, latitude, epoch seconds], ...]} for the requested aircraft."""
+    if _trajectories is None:
+        return {}
+    return _trajectories.trails(icao24s, points)
+
+def get_snapshot_version():
+    """Timestamp (epoch microseconds) of the snapshot last ingested, or None."""
+    with _snapshot_lock:
+        return _snapshot_state["ts_micros"]
+
+def _load_latest_flights():
+    """
+    Loader for the latest_flights cache key. With incremental_fetch enabled a
+    cheap MAX(timestamp) probe runs first and the snapshot is only fetched
+    when the pipeline has written a new one.
+    """
+    # Empty results signal an error in _fetch_latest_flights and must not be cached
+    if not config.get("incremental_fetch", True):
+        df = _fetch_latest_flights()
+        return _record_snapshot(df) if not df.empty else None
+
+    try:
+        ts_micros = _probe_latest_snapshot()
+    except Exception as e:
+        print(f"Error probing latest snapshot: {str(e)}")
+        return None
+    if ts_micros is None:
+        return None
+
+    with _snapshot_lock:
+        _snapshot_state["probes"] += 1
+        if ts_micros == _snapshot_state["ts_micros"] and _snapshot_state["data"] is not None:
+            return _snapshot_state["data"]
+
+    df = _fetch_latest_flights(ts_micros=ts_micros)
+    if df.empty:
+        return None
+    with _snapshot_lock:
+        _snapshot_state["ts_micros"] = ts_micros
+        _snapshot_state["data"] = df
+        _snapshot_state["fetches"] += 1
+        print(f"[Incremental] New snapshot with {len(df)} rows "
+              f"({_snapshot_state['fetches']} fetches in {_snapshot_state['probes']} probes)")
+    return _record_snapshot(df)
+
+_LATEST_FLIGHTS_SELECT = """
+            to_utc_timestamp(timestamp, 'UTC') AS ingest_time,
+            to_utc_timestamp(FROM_UNIXTIME(time_position), 'UTC') AS time_position,
+            to_utc_timestamp(FROM_UNIXTIME(last_contact), 'UTC') AS last_contact,
+            cf.* EXCEPT (time_position, last_contact, timestamp)"""
+
+def _fetch_latest_flights(ts_micros=None):
     """
     Fetch the latest timestamped flight data from the configured catalog and schema.
+    When ts_micros is given only that snapshot is read, skipping the MAX(timestamp) join.
     Returns a pandas DataFrame.
     """
     catalog = config["catalog"]
     schema = config["schema"]
-    host = config["db_host"]
-    token = config["db_token"]
-    http_path = config["db_http_path"]
-
-    where_clause = f"WHERE origin_country = '{selected_country}'" if selected_country else ""
 
-    query = f"""
-   
+    if ts_micros is not None:
+        query = f"""
+        SELECT {_LATEST_FLIGHTS_SELECT}
+        FROM {catalog}.{schema}.opensky_raw cf
+        WHERE cf.timestamp = timestamp_micros(%(ts_micros)s)
+"""
+        parameters = {"ts_micros": int(ts_micros)}
+    else:
+        query = f"""
         WITH latest_timestamp AS (
         SELECT MAX(timestamp) as max_ts
         FROM {catalog}.{schema}.opensky_raw
         )
-        SELECT 
-        
-            to_utc_timestamp(timestamp, 'UTC') AS ingest_time,
-            to_utc_timestamp(FROM_UNIXTIME(time_position), 'UTC') AS time_position,
-            to_utc_timestamp(FROM_UNIXTIME(last_contact), 'UTC') AS last_contact,
-            cf.* EXCEPT (time_position, last_contact, timestamp)
+        SELECT {_LATEST_FLIGHTS_SELECT}
         FROM {catalog}.{schema}.opensky_raw cf
         JOIN latest_timestamp lt 
         ON cf.timestamp = lt.max_ts
-        {where_clause};
 """
+        parameters = None
 
     try:
-        with sql.connect(
-            server_hostname=host,
-            http_path=http_path,
-            access_token=token
-        ) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                result = cursor.fetchall()
-                # Print first row of raw SQL result
-                #print("Raw SQL result:", next(iter(result)))
-                # Print column types from cursor
-                #print("Cursor description:", [(col[0], col[1]) for col in cursor.description])
-
-                
-                df = pd.DataFrame(result, columns=[col[0] for col in cursor.description])
-                df['ingest_time'] = df['ingest_time'].dt.tz_convert('UTC')
-                df['time_position'] = df['time_position'].dt.tz_convert('UTC')
-                df['last_contact'] = df['last_contact'].dt.tz_convert('UTC')
-                #print("Pandas dtypes:", df.dtypes)
-                #print("First row:", df.iloc[0])
-
-                return df
+        df = _execute_query(query, parameters)
+        #print("Pandas dtypes:", df.dtypes)
+
+        df['ingest_time'] = _to_utc(df['ingest_time'])
+        df['time_position'] = _to_utc(df['time_position'])
+        df['last_contact'] = _to_utc(df['last_contact'])
+        #print("Pandas dtypes:", df.dtypes)
+        #print("First row:", df.iloc[0])
+
+        return df
     except KeyError as e:
         raise RuntimeError(f"Missing required config value: {e.args[0]}")
     except Exception as e:
         print(f"Error in get_latest_flight_data: {str(e)}")
         return pd.DataFrame()
 
+def fetch_snapshot_range(start_seconds, end_seconds, country=None):
+    """
+    Fetch every opensky_raw snapshot with start_seconds <= timestamp < end_seconds
+    in one query, with only the columns the live map renders. Rows of all
+    snapshots come back together; ingest_time tells them apart. Raises on
+    errors so a failed range is not mistaken for an empty one.
+    """
+    catalog = config["catalog"]
+    schema = config["schema"]
+    parameters = {"start": int(start_seconds * 1e6), "end": int(end_seconds * 1e6)}
+    country_clause = ""
+    if country:
+        country_clause = "AND origin_country = %(country)s"
+        parameters["country"] = country
+    query = f"""
+        SELECT
+            to_utc_timestamp(timestamp, 'UTC') AS ingest_time,
+            to_utc_timestamp(FROM_UNIXTIME(time_position), 'UTC') AS time_position,
+            icao24, callsign, origin_country, longitude, latitude, velocity, true_track
+        FROM {catalog}.{schema}.opensky_raw
+        WHERE timestamp >= timestamp_micros(%(start)s) AND timestamp < timestamp_micros(%(end)s)
+        {country_clause}
+"""
+    caller = get_caller_info()
+    print(f"[Data Access from {caller}] Querying opensky_raw snapshots from {start_seconds} to {end_seconds}")
+    df = _execute_query(query, parameters)
+    df['ingest_time'] = _to_utc(df['ingest_time'])
+    df['time_position'] = _to_utc(df['time_position'])
+    return df
+
+def _snapshot_extent_query():
+    catalog = config["catalog"]
+    schema = config["schema"]
+    return (f"SELECT unix_micros(MIN(timestamp)) AS first_micros, unix_micros(MAX(timestamp)) AS last_micros "
+            f"FROM {catalog}.{schema}.opensky_raw")
+
+def _load_snapshot_extent():
+    try:
+        return _execute_query(_snapshot_extent_query())
+    except Exception as e:
+        print(f"Error reading the opensky_raw time range: {str(e)}")
+        return None
+
+def get_snapshot_extent():
+    """Return (first, last) opensky_raw snapshot time in epoch seconds, or None."""
+    df = _query_cache.get("snapshot_extent", _load_snapshot_extent, _query_cache.ttl_for("snapshot_extent"))
+    if df is None or df.empty or pd.isna(df['first_micros'].iloc[0]):
+        return None
+    return int(df['first_micros'].iloc[0]) / 1e6, int(df['last_micros'].iloc[0]) / 1e6
+
 def get_caller_info():
     try:
         caller_frame = inspect.currentframe().f_back.f_back
@@ -143,37 +619,205 @@ def get_caller_info():
     except Exception:
         return "unknown"
 
-def query_cache(table_name):
-    cache_settings = {
-        "countries": 60,        # Countries data can be cached for 1 minute        
-        "last_timestamp": 3,    # Flight data needs to be fresh (10 seconds)
-        "all_flights": 60       # 30 seconds cache for all flights
-    }
-    max_age_seconds = cache_settings.get(table_name, 0)
-    if not hasattr(query_cache, '_cache'):
-        query_cache._cache = {}
-        query_cache._cache_hits = 0
-    if (table_name in query_cache._cache and max_age_seconds > 0):
-        cached_entry = query_cache._cache[table_name]
-        cache_time = cached_entry.get('timestamp')
-        cache_age = (datetime.now() - cache_time).total_seconds()
-        if cache_age < max_age_seconds:
-            query_cache._cache_hits += 1
-            return cached_entry['data']
+# Default TTLs in seconds, overridable per table via cache_ttl in config.yaml
+DEFAULT_CACHE_TTLS = {
+    "countries": 60,        # Countries data can be cached for 1 minute
+    "last_timestamp": 3,    # Flight data needs to be fresh
+    "all_flights": 60,      # 1 minute cache for all flights
+    "latest_flights": 3,    # Latest opensky_raw snapshot for the live map
+    "flight_stats": 3,      # Statistics page aggregates computed in the warehouse
+    "snapshot_extent": 60   # First and last opensky_raw snapshot for replay
+}
+
+# Latest snapshot of each cached table on local disk, served right after a restart
+_snapshot_store = SnapshotStore(
+    config.get("snapshot_cache_dir", ".snapshot_cache"),
+    source=f"{config.get('catalog')}.{config.get('schema')}",
+    max_age_seconds=config.get("snapshot_cache_max_age_seconds", 86400),
+    save_seconds=config.get("snapshot_cache_save_seconds", 60)
+) if SnapshotStore is not None and config.get("snapshot_cache", True) else None
+
+def _persist_snapshot(key, data):
+    """Queue a freshly loaded table for the snapshot store; filtered subsets are not kept."""
+    if _snapshot_store is None or not isinstance(data, pd.DataFrame) or data.empty:
+        return
+    if not isinstance(key, str) and key[2]:
+        return
+    # The incremental fetch can skip the first query after a restart when the snapshot is unchanged
+    version = get_snapshot_version() if key == "latest_flights" else None
+    # Written by the store's own thread, so loads never wait on the disk
+    _snapshot_store.save_later(key, data, version)
+
+# Callbacks run after every cache load, e.g. to precompute derived data per snapshot
+_store_listeners = []
+
+def add_cache_listener(listener):
+    """
+    Call listener(key, data) each time a cache key is loaded, with key as
+    returned by cache_key(). It runs on the loading thread, so it should
+    only hand the work to a thread of its own.
+    """
+    _store_listeners.append(listener)
+
+def _on_cache_store(key, data):
+    _persist_snapshot(key, data)
+    for listener in list(_store_listeners):
+        try:
+            listener(key, data)
+        except Exception as e:
+            print(f"[Cache] Listener for {key} failed: {str(e)}")
+
+_query_cache = QueryCache(
+    ttls={**DEFAULT_CACHE_TTLS, **(config.get("cache_ttl") or {})},
+    stale_seconds=config.get("cache_stale_seconds", 0),
+    max_entries=config.get("cache_max_entries", 64),
+    max_bytes=config.get("cache_max_mb", 512) * 1024 * 1024,
+    on_store=_on_cache_store
+)
+
+def _live_fingerprint(key, tables):
+    """
+    Fingerprint of the columns key would load now, from a LIMIT 0 query.
+    tables keeps the fingerprint of each table probed so far, so projections
+    of one table share a probe. None if a projected column no longer exists.
+    """
+    catalog = config["catalog"]
+    schema = config["schema"]
+    if key == "latest_flights":
+        df = _execute_query(f"SELECT {_LATEST_FLIGHTS_SELECT} FROM {catalog}.{schema}.opensky_raw cf LIMIT 0")
+        for column in ('ingest_time', 'time_position', 'last_contact'):
+            df[column] = _to_utc(df[column])
+        return fingerprint(df)
+    if key == "snapshot_extent":
+        return fingerprint(_execute_query(_snapshot_extent_query() + " LIMIT 0"))
+    table_name, columns = (key, None) if isinstance(key, str) else key[:2]
+    if table_name not in tables:
+        query, _ = _build_select(table_name)
+        tables[table_name] = fingerprint(_execute_query(query + " LIMIT 0"))
+    if not columns:
+        return tables[table_name]
+    kinds = dict(tables[table_name])
+    if any(column not in kinds for column in columns):
+        return None
+    return [[column, kinds[column]] for column in columns]
+
+def _restore_checked_snapshots(snapshots):
+    start = time.monotonic()
+    tables = {}
+    restored = 0
+    for key, version, stored, df in snapshots:
+        try:
+            live = _live_fingerprint(key, tables)
+        except Exception as e:
+            print(f"[Snapshot] Cannot check the columns of {key}, not restoring it: {str(e)}")
+            continue
+        if live is None or not fingerprints_match(stored, live):
+            print(f"[Snapshot] Columns of {key} changed in the warehouse, dropping its stored snapshot")
+            _snapshot_store.discard(key)
+            continue
+        _query_cache.warm(key, df)
+        if key == "latest_flights" and version and config.get("incremental_fetch", True):
+            with _snapshot_lock:
+                if _snapshot_state["data"] is None:
+                    _snapshot_state["ts_micros"] = int(version)
+                    _snapshot_state["data"] = df
+        restored += 1
+    print(f"[Snapshot] Restored {restored} of {len(snapshots)} cached tables from {_snapshot_store.directory} "
+          f"in {(time.monotonic() - start) * 1000:.0f} ms")
+
+def restore_snapshot_cache():
+    """
+    Put the snapshots saved by the previous run into the cache. The files are
+    read right away; a background thread then compares the column names and
+    types of each with a LIMIT 0 query on the live table, and only snapshots
+    that still match are served, until the first reload of their table
+    replaces them. Others are deleted. Returns the number of files read.
+    """
+    if _snapshot_store is None:
+        return 0
+    snapshots = _snapshot_store.load_all()
+    if snapshots:
+        threading.Thread(target=_restore_checked_snapshots, args=(snapshots,),
+                         daemon=True, name="snapshot-restore").start()
+    return len(snapshots)
+
+def get_cache_stats():
+    """Return cache hit/miss counters and current size."""
+    return _query_cache.stats()
+
+def cache_key(table_name, columns=None, filters=None):
+    """The cache key query_cache uses for table_name with columns and filters."""
+    filters = _normalize_filters(filters)
+    return table_name if not columns and not filters else (table_name, tuple(columns or ()), filters)
+
+def query_cache(table_name, columns=None, filters=None):
+    """
+    Return the table as a DataFrame, served from the shared cache when fresh.
+    Concurrent misses for the same table share a single warehouse query.
+
+    columns limits the SELECT list, and filters restricts rows either as
+    {column: value} equality or as [(column, operator, value), ...] with
+    operator one of =, !=, <, <=, >, >=, in, "is null", "is not null".
+    Values are bound as query parameters; each projection and filter
+    combination is cached separately with the table's TTL.
+    """
     caller = get_caller_info()
-    print(f"[Data Access from {caller}] Querying database for {table_name} after {query_cache._cache_hits} cache hits")
-    query_cache._cache_hits = 0  # Reset counter after db access
-    df = _query_table(table_name)
-    if df is not None and max_age_seconds > 0:
-        query_cache._cache[table_name] = {
-            'data': df,
-            'timestamp': datetime.now()
-        }
+    filters = _normalize_filters(filters)
+    key = cache_key(table_name, columns, filters)
+
+    def load():
+        stats = _query_cache.stats()
+        print(f"[Data Access from {caller}] Querying database for {table_name} "
+              f"(cache hits: {stats['hits']}, stale hits: {stats['stale_hits']}, misses: {stats['misses']})")
+        df = _query_table(table_name, columns, filters)
+        pool_stats = get_pool_stats()
+        print(f"[Pool] sessions opened: {pool_stats['sessions_opened']}, borrows: {pool_stats['borrows']}, "
+              f"avg wait: {pool_stats['wait_time_avg']*1000:.1f} ms, max wait: {pool_stats['wait_time_max']*1000:.1f} ms")
+        return df
+
+    df = _query_cache.get(key, load, _query_cache.ttl_for(table_name))
+    _refresh_key(key, lambda: _query_table(table_name, columns, filters), _query_cache.ttl_for(table_name))
     return df
 
-def get_all_flights():
+def _load_flight_stats():
+    """Compute the statistics page aggregates in the warehouse; None if that fails."""
+    catalog = config["catalog"]
+    schema = config["schema"]
+    queries = flight_stats_queries(
+        f"{catalog}.{schema}.last_timestamp",
+        climb_rate=config.get('phase_climb_rate', 2.5),
+        descent_rate=config.get('phase_descent_rate', -2.5)
+    )
+    caller = get_caller_info()
     try:
-        df = query_cache("all_flights")
+        print(f"[Data Access from {caller}] Querying flight statistics aggregates")
+        return parse_flight_stats({name: _execute_query(query) for name, query in queries.items()})
+    except Exception as e:
+        print(f"Error in flight statistics pushdown from {caller}: {str(e)}")
+        return None
+
+def get_flight_stats():
+    """
+    Return the statistics page aggregates (see utils.flight_stats).
+    With stats_pushdown enabled only the aggregates are transferred from the
+    warehouse; otherwise, or if pushdown fails, they are computed locally
+    from the cached last_timestamp table.
+    """
+    if config.get("stats_pushdown", True):
+        stats = _query_cache.get("flight_stats", _load_flight_stats, _query_cache.ttl_for("flight_stats"))
+        _refresh_key("flight_stats", _load_flight_stats, _query_cache.ttl_for("flight_stats"))
+        if stats is not None:
+            return stats
+        print("[Stats] Pushdown unavailable, computing statistics locally")
+    return compute_flight_stats(
+        query_cache("last_timestamp"),
+        climb_rate=config.get('phase_climb_rate', 2.5),
+        descent_rate=config.get('phase_descent_rate', -2.5)
+    )
+
+def get_all_flights(columns=None):
+    try:
+        df = query_cache("all_flights", columns=columns)
         if df is not None and not df.empty:
             return df
         caller = get_caller_info()
@@ -182,4 +826,132 @@ def get_all_flights():
     except Exception as e:
         caller = get_caller_info()
         print(f"[Data Access from {caller}] Error retrieving flight data: {str(e)}")
-        return pd.DataFrame()  # Return empty DataFrame on error
\ No newline at end of file
+        return pd.DataFrame()  # Return empty DataFrame on error
+
+class BackgroundRefresher:
+    """
+    Periodically reloads hot cache keys ahead of their TTL so user callbacks
+    are served from memory. Each key refreshes on its own cadence, backs off
+    when the warehouse is slow or failing, and is paused while nobody has
+    requested it for idle_seconds. Keys in always_on are never paused.
+    Keys can be added while running, so the refresher follows the projected
+    and filtered keys pages actually request.
+    """
+
+    def __init__(self, cache, jobs, lead_fraction=0.8, slow_seconds=5, max_backoff=8, idle_seconds=300, always_on=()):
+        self.cache = cache
+        self.always_on = set(always_on)
+        self.lead_fraction = lead_fraction
+        self.slow_seconds = slow_seconds
+        self.max_backoff = max_backoff
+        self.idle_seconds = idle_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_at = None
+        self._jobs_lock = threading.Lock()
+        now = time.monotonic()
+        # key -> loader, ttl, current backoff factor and next due time
+        self._jobs = {
+            key: {"loader": loader, "ttl": ttl, "backoff": 1, "due": now}
+            for key, (loader, ttl) in jobs.items() if ttl > 0
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="cache-refresher")
+        self._thread.start()
+        print(f"[Refresher] Started for {', '.join(self._jobs)}")
+
+    def stop(self):
+        self._stop.set()
+
+    def add(self, key, loader, ttl):
+        """Refresh key from now on; the first refresh is due shortly before its TTL expires."""
+        if ttl <= 0:
+            return
+        with self._jobs_lock:
+            if key not in self._jobs:
+                self._jobs[key] = {"loader": loader, "ttl": ttl, "backoff": 1,
+                                   "due": time.monotonic() + ttl * self.lead_fraction}
+                print(f"[Refresher] Now refreshing {key}")
+
+    def _is_idle(self, key, now):
+        if key in self.always_on:
+            return False
+        last = self.cache.last_requested(key) or self._started_at
+        return now - last > self.idle_seconds
+
+    def _run_job(self, key, job):
+        loaded = []
+
+        def load():
+            loaded.append(job["loader"]())
+            return loaded[-1]
+
+        start = time.monotonic()
+        try:
+            self.cache.refresh(key, load, job["ttl"])
+            # The loaders report warehouse errors by returning None, which the cache does not store
+            failed = bool(loaded) and loaded[-1] is None
+            if failed:
+                print(f"[Refresher] Refresh of {key} returned no data")
+        except Exception as e:
+            print(f"[Refresher] Refresh of {key} failed: {str(e)}")
+            failed = True
+        elapsed = time.monotonic() - start
+        if failed or elapsed > self.slow_seconds:
+            job["backoff"] = min(job["backoff"] * 2, self.max_backoff)
+            print(f"[Refresher] {key} took {elapsed:.1f}s, backing off x{job['backoff']}")
+        else:
+            job["backoff"] = 1
+        job["due"] = time.monotonic() + job["ttl"] * self.lead_fraction * job["backoff"]
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            with self._jobs_lock:
+                jobs = list(self._jobs.items())
+            for key, job in jobs:
+                if job["due"] > now:
+                    continue
+                if self._is_idle(key, now):
+                    # Check again shortly so a returning user is picked up quickly
+                    job["due"] = now + job["ttl"]
+                    continue
+                self._run_job(key, job)
+            # Wake at least every second to pick up keys added in the meantime
+            next_due = min([job["due"] for _, job in jobs] + [now + 1])
+            self._stop.wait(max(0.1, next_due - time.monotonic()))
+
+_refresher = None
+
+def _refresh_key(key, loader, ttl):
+    """Let the background refresher keep a key that was just requested warm."""
+    if _refresher is not None:
+        _refresher.add(key, loader, ttl)
+
+def start_background_refresh():
+    """
+    Start pre-warming the latest opensky_raw snapshot, and every key the
+    pages request through query_cache or get_flight_stats from then on.
+    Safe to call more than once.
+    """
+    global _refresher
+    if not config.get("background_refresh", True):
+        return None
+    if _refresher is None:
+        jobs = {"latest_flights": (_load_latest_flights, _query_cache.ttl_for("latest_flights"))}
+        _refresher = BackgroundRefresher(
+            _query_cache,
+            jobs,
+            slow_seconds=config.get("refresh_slow_seconds", 5),
+            max_backoff=config.get("refresh_max_backoff", 8),
+            idle_seconds=config.get("refresh_idle_seconds", 300),
+            # Keeps the fleet series free of gaps while nobody has a page open
+            always_on=("latest_flights",) if _fleet_series is not None and config.get("fleet_series_record_idle", False) else ()
+        )
+    _refresher.start()
+    return _refresher
@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class DatasetRegistry:
+    """
+    Server-side store for DataFrames that pages would otherwise round-trip
+    through a dcc.Store. register() returns a small JSON handle (dataset name,
+    snapshot id and parameters) to keep in the browser; resolve() turns it back
+    into the DataFrame while the entry has not expired.
+
+    A snapshot id changes whenever register() is called with a different
+    source object, so the same snapshot and parameters are only built once.
+    """
+
+    def __init__(self, ttl_seconds=600, max_entries=32):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Distinguishes handles issued by different server processes
+        self._registry_id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> {'data', 'expires'}
+        self._snapshots = {}            # dataset name -> (source, snapshot id)
+        self._sequence = 0
+
+    @staticmethod
+    def _key(handle):
+        return json.dumps(handle, sort_keys=True)
+
+    def _snapshot_id(self, name, source):
+        with self._lock:
+            current = self._snapshots.get(name)
+            if current is not None and current[0] is source:
+                return current[1]
+            self._sequence += 1
+            snapshot_id = f"{self._registry_id}-{self._sequence}"
+            self._snapshots[name] = (source, snapshot_id)
+            return snapshot_id
+
+    def _expire(self, now):
+        # Called with the lock held
+        for key in [key for key, entry in self._entries.items() if entry['expires'] <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def register(self, name, source, build=None, **params):
+        """
+        Register build(source, **params) (or source itself without build)
+        under name and return its handle. Nothing is rebuilt when the same
+        source and parameters are registered again before expiry.
+        """
+        handle = {"dataset": name, "snapshot": self._snapshot_id(name, source), "params": params}
+        key = self._key(handle)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires'] > now:
+                entry['expires'] = now + self.ttl_seconds
+                self._entries.move_to_end(key)
+                return handle
+
+        data = build(source, **params) if build is not None else source
+        with self._lock:
+            self._entries[key] = {'data': data, 'expires': now + self.ttl_seconds}
+            self._entries.move_to_end(key)
+            self._expire(now)
+        return handle
+
+    def resolve(self, handle):
+        """Return the DataFrame for handle, or None if it is unknown or expired."""
+        if not isinstance(handle, dict):
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(self._key(handle))
+            if entry is None or entry['expires'] <= now:
+                return None
+            entry['expires'] = now + self.ttl_seconds
+            self._entries.move_to_end(self._key(handle))
+            return entry['data']
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "datasets": len(self._snapshots)}
@@ -0,0 +1,191 @@
+"""
+Rolling fleet-level time series for the statistics page.
+
+FleetTimeSeries keeps one row of aggregates per snapshot (total aircraft,
+counts per flight phase, airborne mean altitude and speed, aircraft per
+origin country) for the last window_hours. Rows live in preallocated
+columnar arrays used as a ring buffer, so adding a snapshot costs one pass
+over its rows and the trend charts never query opensky_raw history. The
+window is saved to an .npz file every few minutes and restored from it on
+startup.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.flight_phase import (
+    classify_flight_phase, DEFAULT_CLIMB_RATE, DEFAULT_DESCENT_RATE,
+    PHASE_ON_GROUND, PHASE_ASCENDING, PHASE_DESCENDING, PHASE_CRUISING
+)
+
+PHASES = [PHASE_ON_GROUND, PHASE_ASCENDING, PHASE_DESCENDING, PHASE_CRUISING]
+MEAN_COLUMNS = ['geo_altitude', 'velocity']
+
+
+class FleetTimeSeries:
+
+    def __init__(self, window_hours=3, max_snapshots=2160, max_countries=256, path=None, save_seconds=300,
+                 climb_rate=DEFAULT_CLIMB_RATE, descent_rate=DEFAULT_DESCENT_RATE):
+        self.window_seconds = window_hours * 3600
+        self.max_snapshots = max_snapshots
+        self.max_countries = max_countries
+        self.path = path
+        self.save_seconds = save_seconds
+        self.climb_rate = climb_rate
+        self.descent_rate = descent_rate
+        self._lock = threading.Lock()
+        self._time = np.zeros(max_snapshots, dtype=np.float64)                         # epoch seconds
+        self._total = np.zeros(max_snapshots, dtype=np.int32)
+        self._phases = np.zeros((max_snapshots, len(PHASES)), dtype=np.int32)
+        self._means = np.full((max_snapshots, len(MEAN_COLUMNS)), np.nan, dtype=np.float32)
+        self._countries = np.zeros((max_snapshots, max_countries), dtype=np.int32)
+        self._country_names = []                                                     # column -> country
+        self._country_columns = {}                                                   # country -> column
+        self._head = 0      # next row to write
+        self._count = 0     # rows in the window
+        self._snapshot = None
+        self._saved_at = time.monotonic()
+        if path:
+            self.load(path)
+
+    def _rows(self):
+        # Called with the lock held; ring positions oldest first
+        return (self._head - self._count + np.arange(self._count)) % self.max_snapshots
+
+    def _country_column(self, country):
+        # Called with the lock held; None once max_countries are tracked
+        column = self._country_columns.get(country)
+        if column is None and len(self._country_names) < self.max_countries:
+            column = len(self._country_names)
+            self._country_names.append(country)
+            self._country_columns[country] = column
+        return column
+
+    def add(self, timestamp, df):
+        """Add the aggregates of snapshot df taken at timestamp (epoch seconds); older snapshots are ignored."""
+        if df is None or df.empty or self._snapshot is df:
+            return False
+        with self._lock:
+            if self._count and timestamp <= self._time[(self._head - 1) % self.max_snapshots]:
+                return False
+
+        phases = classify_flight_phase(df, climb_rate=self.climb_rate, descent_rate=self.descent_rate).value_counts()
+        on_ground = (df['on_ground'] == True) if 'on_ground' in df.columns else pd.Series(False, index=df.index)
+        airborne = df[~on_ground]
+        means = [
+            pd.to_numeric(airborne[column], errors='coerce').mean() if column in airborne.columns else np.nan
+            for column in MEAN_COLUMNS
+        ]
+        countries = df['origin_country'].value_counts() if 'origin_country' in df.columns else pd.Series(dtype='int64')
+
+        with self._lock:
+            self._snapshot = df
+            # Drop snapshots that fell out of the window
+            while self._count and self._time[(self._head - self._count) % self.max_snapshots] < timestamp - self.window_seconds:
+                self._count -= 1
+            row = self._head
+            self._time[row] = timestamp
+            self._total[row] = len(df)
+            self._phases[row] = [int(phases.get(phase, 0)) for phase in PHASES]
+            self._means[row] = means
+            self._countries[row] = 0
+            for country, count in countries.items():
+                column = self._country_column(country)
+                if column is not None:
+                    self._countries[row, column] = count
+            self._head = (self._head + 1) % self.max_snapshots
+            self._count = min(self._count + 1, self.max_snapshots)
+            save = self.path and time.monotonic() - self._saved_at >= self.save_seconds
+        if save:
+            self.save(self.path)
+        return True
+
+    def frame(self):
+        """
+        The window oldest first as a DataFrame indexed by snapshot time, with
+        total, one column per phase and the airborne mean of each MEAN_COLUMNS.
+        """
+        with self._lock:
+            rows = self._rows()
+            data = {'total': self._total[rows]}
+            data.update({phase: self._phases[rows, i] for i, phase in enumerate(PHASES)})
+            data.update({f'{column}_mean': self._means[rows, i] for i, column in enumerate(MEAN_COLUMNS)})
+            index = pd.to_datetime(self._time[rows], unit='s', utc=True)
+        return pd.DataFrame(data, index=index)
+
+    def countries(self, top=5):
+        """Aircraft per origin country over the window for the top countries of the newest snapshot."""
+        with self._lock:
+            rows = self._rows()
+            if not len(rows) or not self._country_names:
+                return pd.DataFrame()
+            counts = self._countries[rows, :len(self._country_names)]
+            columns = np.argsort(-counts[-1], kind='stable')[:top]
+            columns = columns[counts[-1, columns] > 0]
+            index = pd.to_datetime(self._time[rows], unit='s', utc=True)
+            return pd.DataFrame(counts[:, columns], index=index, columns=[self._country_names[c] for c in columns])
+
+    def save(self, path):
+        """Write the window to path atomically."""
+        with self._lock:
+            rows = self._rows()
+            data = {
+                'time': self._time[rows],
+                'total': self._total[rows],
+                'phases': self._phases[rows],
+                'means': self._means[rows],
+                'countries': self._countries[rows, :len(self._country_names)],
+                'country_names': np.array(self._country_names, dtype=str),
+                'phase_names': np.array(PHASES, dtype=str),
+                'mean_columns': np.array(MEAN_COLUMNS, dtype=str)
+            }
+            self._saved_at = time.monotonic()
+        temporary = f"{path}.tmp"
+        try:
+            with open(temporary, 'wb') as f:
+                np.savez_compressed(f, **data)
+            os.replace(temporary, path)
+        except Exception as e:
+            print(f"[FleetSeries] Error saving {path}: {str(e)}")
+
+    def load(self, path):
+        """Restore a window written by save(), keeping the snapshots still inside window_hours."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if list(data['phase_names']) != PHASES or list(data['mean_columns']) != MEAN_COLUMNS:
+                    print(f"[FleetSeries] Ignoring {path} written with different columns")
+                    return False
+                times = data['time']
+                keep = np.flatnonzero(times >= time.time() - self.window_seconds)[-self.max_snapshots:]
+                names = [str(name) for name in data['country_names']][:self.max_countries]
+                with self._lock:
+                    count = len(keep)
+                    self._time[:count] = times[keep]
+                    self._total[:count] = data['total'][keep]
+                    self._phases[:count] = data['phases'][keep]
+                    self._means[:count] = data['means'][keep]
+                    self._countries[:count, :len(names)] = data['countries'][keep, :len(names)]
+                    self._country_names = names
+                    self._country_columns = {name: column for column, name in enumerate(names)}
+                    self._head = count % self.max_snapshots
+                    self._count = count
+            print(f"[FleetSeries] Restored {count} snapshots from {path}")
+            return True
+        except Exception as e:
+            print(f"[FleetSeries] Error loading {path}: {str(e)}")
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "snapshots": self._count,
+                "capacity": self.max_snapshots,
+                "countries": len(self._country_names),
+                "bytes": self._time.nbytes + self._total.nbytes + self._phases.nbytes
+                         + self._means.nbytes + self._countries.nbytes
+            }
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+PHASE_ON_GROUND = 'On Ground'
+PHASE_ASCENDING = 'Ascending'
+PHASE_DESCENDING = 'Descending'
+PHASE_CRUISING = 'Cruising'
+
+_PHASE_LABELS = np.array([PHASE_ON_GROUND, PHASE_ASCENDING, PHASE_DESCENDING, PHASE_CRUISING], dtype=object)
+
+# Vertical rate thresholds in m/s
+DEFAULT_CLIMB_RATE = 2.5
+DEFAULT_DESCENT_RATE = -2.5
+
+
+def classify_flight_phase(df, climb_rate=DEFAULT_CLIMB_RATE, descent_rate=DEFAULT_DESCENT_RATE,
+                          on_ground_col='on_ground', vertical_rate_col='vertical_rate'):
+    """
+    Classify every row of df as On Ground, Ascending, Descending or Cruising.
+
+    Aircraft on the ground come first; airborne aircraft climbing faster than
+    climb_rate are Ascending, those sinking faster than descent_rate are
+    Descending, and everything else (including a missing vertical rate) is
+    Cruising. Returns a Series aligned with df.index.
+    """
+    if on_ground_col in df.columns:
+        on_ground = (df[on_ground_col] == True).to_numpy()
+    else:
+        on_ground = np.zeros(len(df), dtype=bool)
+
+    if vertical_rate_col in df.columns:
+        # NaN compares False, so a missing vertical rate falls through to Cruising
+        vertical_rate = pd.to_numeric(df[vertical_rate_col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    else:
+        vertical_rate = np.full(len(df), np.nan)
+
+    # Select integer codes and map them to labels once, which is much cheaper than selecting strings
+    codes = np.select(
+        [on_ground, vertical_rate > climb_rate, vertical_rate < descent_rate],
+        [0, 1, 2],
+        default=3
+    )
+    return pd.Series(_PHASE_LABELS[codes], index=df.index, name='flight_phase')
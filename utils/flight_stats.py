@@ -0,0 +1,186 @@
+"""
+Fleet aggregates behind the statistics page.
+
+The same result can be computed two ways: pushed down to the warehouse with
+flight_stats_queries / parse_flight_stats, or locally from a snapshot
+DataFrame with compute_flight_stats. Both return a dict with the phase
+counts, binned altitude and speed histograms with their means, the top
+origin countries and the notable aircraft records.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.flight_phase import (
+    classify_flight_phase, DEFAULT_CLIMB_RATE, DEFAULT_DESCENT_RATE,
+    PHASE_ON_GROUND, PHASE_ASCENDING, PHASE_DESCENDING, PHASE_CRUISING
+)
+
+HISTOGRAM_BINS = 50
+# Histogram ranges match the chart axes; values outside are not counted
+HISTOGRAM_RANGES = {
+    'geo_altitude': (0, 15000),
+    'velocity': (0, 350)
+}
+TOP_COUNTRIES = 15
+
+# (category, column, max or min) for the notable aircraft table
+RECORDS = [
+    ('Fastest Plane', 'velocity', 'max'),
+    ('Highest Plane', 'geo_altitude', 'max'),
+    ('Max Climb Rate', 'vertical_rate', 'max'),
+    ('Max Descent Rate', 'vertical_rate', 'min')
+]
+
+
+def _empty_stats():
+    return {
+        'total': 0,
+        'phases': pd.Series(dtype='int64'),
+        'histograms': {},
+        'countries': pd.Series(dtype='int64'),
+        'records': []
+    }
+
+
+def _phase_series(on_ground, ascending, descending, cruising):
+    """Phase counts sorted like value_counts(), without empty phases."""
+    phases = pd.Series({
+        PHASE_ON_GROUND: on_ground,
+        PHASE_ASCENDING: ascending,
+        PHASE_DESCENDING: descending,
+        PHASE_CRUISING: cruising
+    }, dtype='int64')
+    return phases[phases > 0].sort_values(ascending=False, kind='stable')
+
+
+def _histogram(counts, column, mean):
+    low, high = HISTOGRAM_RANGES[column]
+    return {
+        'edges': np.linspace(low, high, HISTOGRAM_BINS + 1),
+        'counts': np.asarray(counts, dtype='int64'),
+        'mean': None if mean is None or pd.isna(mean) else float(mean)
+    }
+
+
+def compute_flight_stats(df, climb_rate=DEFAULT_CLIMB_RATE, descent_rate=DEFAULT_DESCENT_RATE):
+    """Compute the statistics page aggregates from a snapshot DataFrame."""
+    if df is None or df.empty:
+        return _empty_stats()
+
+    phases = classify_flight_phase(df, climb_rate=climb_rate, descent_rate=descent_rate).value_counts()
+    stats = _empty_stats()
+    stats['total'] = len(df)
+    stats['phases'] = _phase_series(*(int(phases.get(p, 0)) for p in
+                                      (PHASE_ON_GROUND, PHASE_ASCENDING, PHASE_DESCENDING, PHASE_CRUISING)))
+
+    on_ground = (df['on_ground'] == True) if 'on_ground' in df.columns else pd.Series(False, index=df.index)
+    airborne = df[~on_ground]
+
+    for column, (low, high) in HISTOGRAM_RANGES.items():
+        if column not in df.columns:
+            continue
+        values = pd.to_numeric(airborne[column], errors='coerce').dropna()
+        counts, _ = np.histogram(values, bins=HISTOGRAM_BINS, range=(low, high))
+        stats['histograms'][column] = _histogram(counts, column, values.mean() if len(values) else None)
+
+    if 'origin_country' in df.columns:
+        stats['countries'] = df['origin_country'].value_counts().head(TOP_COUNTRIES)
+
+    for category, column, extreme in RECORDS:
+        if column not in airborne.columns:
+            continue
+        values = pd.to_numeric(airborne[column], errors='coerce')
+        if values.notna().any():
+            idx = values.idxmax() if extreme == 'max' else values.idxmin()
+            stats['records'].append({
+                'category': category,
+                'column': column,
+                'callsign': airborne.at[idx, 'callsign'] if 'callsign' in airborne.columns else None,
+                'country': airborne.at[idx, 'origin_country'] if 'origin_country' in airborne.columns else None,
+                'value': float(values[idx])
+            })
+    return stats
+
+
+def flight_stats_queries(table, climb_rate=DEFAULT_CLIMB_RATE, descent_rate=DEFAULT_DESCENT_RATE):
+    """
+    SQL computing the same aggregates in the warehouse. Returns a dict of
+    queries whose results parse_flight_stats combines; each result is at most
+    a few hundred rows.
+    """
+    airborne = "NOT coalesce(on_ground, false)"
+    record_columns = ",\n            ".join(
+        f"{extreme}_by(callsign, CASE WHEN {airborne} THEN {column} END) AS record{i}_callsign,\n            "
+        f"{extreme}_by(origin_country, CASE WHEN {airborne} THEN {column} END) AS record{i}_country,\n            "
+        f"{extreme}(CASE WHEN {airborne} THEN {column} END) AS record{i}_value"
+        for i, (_, column, extreme) in enumerate(RECORDS)
+    )
+    histograms = "\n        UNION ALL\n".join(
+        f"""        SELECT '{column}' AS metric, width_bucket({column}, {low}, {high}, {HISTOGRAM_BINS}) AS bucket, COUNT(*) AS count
+        FROM {table}
+        WHERE {airborne} AND {column} >= {low} AND {column} <= {high}
+        GROUP BY 2"""
+        for column, (low, high) in HISTOGRAM_RANGES.items()
+    )
+    return {
+        'summary': f"""
+        SELECT
+            COUNT(*) AS total,
+            COUNT_IF(coalesce(on_ground, false)) AS on_ground,
+            COUNT_IF({airborne} AND vertical_rate > {float(climb_rate)}) AS ascending,
+            COUNT_IF({airborne} AND vertical_rate < {float(descent_rate)}) AS descending,
+            AVG(CASE WHEN {airborne} THEN geo_altitude END) AS geo_altitude_mean,
+            AVG(CASE WHEN {airborne} THEN velocity END) AS velocity_mean,
+            {record_columns}
+        FROM {table}
+""",
+        'histograms': histograms,
+        'countries': f"""
+        SELECT origin_country, COUNT(*) AS count
+        FROM {table}
+        WHERE origin_country IS NOT NULL
+        GROUP BY origin_country
+        ORDER BY count DESC
+        LIMIT {TOP_COUNTRIES}
+"""
+    }
+
+
+def parse_flight_stats(results):
+    """Combine the DataFrames returned for flight_stats_queries into the stats dict."""
+    summary = results['summary'].iloc[0]
+    stats = _empty_stats()
+    stats['total'] = int(summary['total'])
+    if stats['total'] == 0:
+        return stats
+
+    on_ground = int(summary['on_ground'])
+    ascending = int(summary['ascending'])
+    descending = int(summary['descending'])
+    stats['phases'] = _phase_series(on_ground, ascending, descending,
+                                    stats['total'] - on_ground - ascending - descending)
+
+    histograms = results['histograms']
+    for column, (low, high) in HISTOGRAM_RANGES.items():
+        counts = np.zeros(HISTOGRAM_BINS, dtype='int64')
+        rows = histograms[histograms['metric'] == column]
+        # width_bucket puts the upper edge into bucket bins + 1; np.histogram closes the last bin
+        buckets = np.clip(rows['bucket'].to_numpy(dtype='int64'), 1, HISTOGRAM_BINS) - 1
+        np.add.at(counts, buckets, rows['count'].to_numpy(dtype='int64'))
+        stats['histograms'][column] = _histogram(counts, column, summary[f'{column}_mean'])
+
+    countries = results['countries']
+    stats['countries'] = pd.Series(countries['count'].to_numpy(dtype='int64'),
+                                   index=countries['origin_country'].to_numpy(), name='count')
+
+    for i, (category, column, _) in enumerate(RECORDS):
+        value = summary[f'record{i}_value']
+        if pd.notna(value):
+            stats['records'].append({
+                'category': category,
+                'column': column,
+                'callsign': summary[f'record{i}_callsign'],
+                'country': summary[f'record{i}_country'],
+                'value': float(value)
+            })
+    return stats
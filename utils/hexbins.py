@@ -0,0 +1,55 @@
+"""
+H3 aggregation of aircraft positions for the deck.gl density layers.
+
+Instead of shipping (and sampling) raw points, each snapshot is binned into
+H3 cells and only the weighted cell centroids are sent to the browser. The
+deck.gl layers sum the weights, so every aircraft still contributes.
+"""
+import h3
+import numpy as np
+import pandas as pd
+
+# Average H3 hexagon edge length in meters per resolution
+H3_EDGE_METERS = [
+    1107712.591, 418676.006, 158244.656, 59810.858, 22606.379, 8544.408,
+    3229.483, 1220.630, 461.355, 174.376, 65.908
+]
+
+# Resolution used for the heatmap layer, whose radius is in pixels
+HEATMAP_RESOLUTION = 5
+
+
+def resolution_for_radius(radius_m):
+    """
+    Coarsest H3 resolution whose cells are at most half the hexagon radius,
+    so each rendered hexagon is built from several cells.
+    """
+    for resolution, edge in enumerate(H3_EDGE_METERS):
+        if edge <= radius_m / 2:
+            return resolution
+    return len(H3_EDGE_METERS) - 1
+
+
+def aggregate_h3(points, resolution):
+    """
+    Bin points (columns lat, lng and optional weight) into H3 cells.
+    Returns one row per cell with its centroid as lat/lng, the summed
+    weight and the cell index as hex.
+    """
+    if points is None or len(points) == 0:
+        return pd.DataFrame(columns=['lat', 'lng', 'weight', 'hex'])
+
+    lats = points['lat'].to_numpy(dtype=float)
+    lngs = points['lng'].to_numpy(dtype=float)
+    weights = points['weight'].to_numpy(dtype=float) if 'weight' in points.columns else np.ones(len(points))
+
+    cells = [h3.geo_to_h3(lat, lng, resolution) for lat, lng in zip(lats, lngs)]
+    totals = pd.Series(weights).groupby(cells, sort=False).sum()
+
+    centroids = np.array([h3.h3_to_geo(cell) for cell in totals.index]).reshape(-1, 2)
+    return pd.DataFrame({
+        'lat': centroids[:, 0],
+        'lng': centroids[:, 1],
+        'weight': totals.to_numpy(),
+        'hex': totals.index.to_numpy()
+    })
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.wire import encode_planes_base64
+
+# Columns the streaming map actually renders
+PLANE_COLUMNS = [
+    'icao24',
+    'callsign',
+    'origin_country',
+    'longitude',
+    'latitude',
+    'velocity',
+    'true_track',
+    'time_position'
+]
+
+
+def drop_stale_planes(df, minutes, newest=None):
+    """
+    Drop aircraft whose last position is more than minutes older than the
+    newest one (or than newest, e.g. when df is only part of a snapshot).
+    """
+    recent_time_position = df['time_position'].max() if newest is None else newest
+    return df[df['time_position'] > (recent_time_position - pd.Timedelta(minutes=minutes))]
+
+
+def project_planes(df):
+    """Reduce a snapshot to PLANE_COLUMNS, indexed by icao24."""
+    columns = [col for col in PLANE_COLUMNS if col in df.columns]
+    return df[columns].drop_duplicates('icao24', keep='last').set_index('icao24')
+
+
+def _records(planes):
+    planes = planes.reset_index()
+    # time_position is sent as an ISO string for the browser
+    if 'time_position' in planes.columns and pd.api.types.is_datetime64_any_dtype(planes['time_position']):
+        planes['time_position'] = planes['time_position'].dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    # NaN is not valid JSON; send missing values as null
+    return planes.astype(object).where(planes.notna(), None).to_dict("records")
+
+
+def _encode(update, added, updated, encoding):
+    """Attach changed planes to update as JSON records or as one binary table."""
+    if encoding == "bin":
+        update["encoding"] = "bin"
+        update["planes"] = encode_planes_base64(pd.concat([added, updated]))
+    else:
+        update["added"] = _records(added)
+        update["updated"] = _records(updated)
+    return update
+
+
+def diff_planes(previous, current):
+    """
+    Compare two projected snapshots and return (added, updated, removed):
+    new aircraft, aircraft whose values changed, and the icao24 codes that
+    disappeared.
+    """
+    removed = previous.index.difference(current.index)
+    added = current.index.difference(previous.index)
+    common = current.index.intersection(previous.index)
+
+    now = current.loc[common]
+    before = previous.loc[common, now.columns]
+    unchanged = ((now == before) | (now.isna() & before.isna())).all(axis=1)
+
+    return current.loc[added], now[~unchanged], removed.tolist()
+
+
+class PlaneFeed:
+    """
+    Keeps the last few projected snapshots so each client can be sent only
+    the changes since the version it already shows. Versions must identify
+    both the snapshot and any filter applied to it (e.g. the country).
+    """
+
+    def __init__(self, history=8):
+        self.history = history
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()   # version -> projected DataFrame
+
+    def _remember(self, version, planes):
+        with self._lock:
+            self._snapshots[version] = planes
+            self._snapshots.move_to_end(version)
+            while len(self._snapshots) > self.history:
+                self._snapshots.popitem(last=False)
+
+    def _lookup(self, version):
+        with self._lock:
+            return self._snapshots.get(version)
+
+    def payload(self, df, version, client_version=None, encoding="json"):
+        """
+        Build the message for a client that currently shows client_version.
+        Returns a full snapshot when the client's version is unknown, otherwise
+        a delta against it. With encoding="bin" changed planes are sent as a
+        base64 utils.wire table in "planes" instead of "added"/"updated".
+        """
+        planes = self._lookup(version)
+        if planes is None:
+            planes = project_planes(df)
+            self._remember(version, planes)
+
+        base = self._lookup(client_version) if client_version is not None else None
+        if base is None:
+            update = {"mode": "full", "version": version, "base_version": None, "removed": [], "count": len(planes)}
+            return _encode(update, planes, planes.iloc[0:0], encoding)
+
+        if client_version == version:
+            added, updated, removed = planes.iloc[0:0], planes.iloc[0:0], []
+        else:
+            added, updated, removed = diff_planes(base, planes)
+        update = {"mode": "delta", "version": version, "base_version": client_version, "removed": removed, "count": len(planes)}
+        return _encode(update, added, updated, encoding)
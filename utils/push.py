@@ -0,0 +1,213 @@
+import json
+import queue
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from flask import Response, request
+
+from utils.live_feed import PlaneFeed, drop_stale_planes
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SnapshotBroadcaster:
+    """
+    Fan-out of live plane messages to Server-Sent Events subscribers.
+    Each channel, a (country, encoding) pair, keeps its latest full snapshot
+    so new subscribers can start immediately; later snapshots are sent as
+    deltas.
+    """
+
+    def __init__(self, keepalive_seconds=15):
+        self.keepalive_seconds = keepalive_seconds
+        self._lock = threading.Lock()
+        self._subscribers = {}   # channel -> set of queues
+        self._latest = {}        # channel -> latest full snapshot message
+
+    def channels(self):
+        """Channels with at least one subscriber."""
+        with self._lock:
+            return [channel for channel, queues in self._subscribers.items() if queues]
+
+    def publish(self, channel, full_message, delta_message=None):
+        """Send delta_message (or full_message when there is no delta) to every subscriber of channel."""
+        message = _sse(*(delta_message or full_message))
+        with self._lock:
+            self._latest[channel] = _sse(*full_message)
+            queues = list(self._subscribers.get(channel, ()))
+        for q in queues:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Slow client: drop its backlog and tell it to resync
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+
+    def subscribe(self, channel):
+        q = queue.Queue(maxsize=8)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(q)
+            latest = self._latest.get(channel)
+        return q, latest
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            self._subscribers.get(channel, set()).discard(q)
+
+    def stream(self, channel):
+        q, latest = self.subscribe(channel)
+        try:
+            yield "retry: 3000\n\n"
+            if latest:
+                yield latest
+            while True:
+                try:
+                    message = q.get(timeout=self.keepalive_seconds)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    yield _sse("resync", {})
+                    return
+                yield message
+        finally:
+            self.unsubscribe(channel, q)
+
+
+class SnapshotPublisher:
+    """
+    Polls source(country) for the newest snapshot of every subscribed channel
+    and broadcasts it once per new ingest_time.
+    """
+
+    def __init__(self, broadcaster, source, poll_seconds=1.0, filter_minutes=2):
+        self.broadcaster = broadcaster
+        self.source = source
+        self.poll_seconds = poll_seconds
+        self.filter_minutes = filter_minutes
+        self._feed = PlaneFeed()
+        self._versions = {}      # channel -> last published version
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="plane-publisher")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def publish_channel(self, channel):
+        country, encoding = channel
+        df = self.source(None if country == "ALL" else country)
+        if df is None or df.empty:
+            return
+        recent_timestamp = df['ingest_time'].max()
+        version = f"{country}@{recent_timestamp.isoformat()}"
+        previous = self._versions.get(channel)
+        if version == previous:
+            return
+
+        df = drop_stale_planes(df, self.filter_minutes)
+        current_time = datetime.now(timezone.utc)
+        meta = {
+            "last_refresh": current_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "last_data": recent_timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "last_time_diff": int((current_time - recent_timestamp).total_seconds())
+        }
+        full = self._feed.payload(df, version, encoding=encoding)
+        delta = self._feed.payload(df, version, previous, encoding=encoding) if previous else None
+        self.broadcaster.publish(
+            channel,
+            ("plane_update", {**meta, "update": full}),
+            ("plane_update", {**meta, "update": delta}) if delta and delta["mode"] == "delta" else None
+        )
+        self._versions[channel] = version
+
+    def _run(self):
+        while not self._stop.is_set():
+            for channel in self.broadcaster.channels():
+                try:
+                    self.publish_channel(channel)
+                except Exception as e:
+                    print(f"[Push] Error publishing {channel}: {str(e)}")
+            self._stop.wait(self.poll_seconds)
+
+
+class FakeSnapshotSource:
+    """
+    Generates moving aircraft in memory for local testing of the push channel
+    without a warehouse. A new snapshot is produced every interval_seconds.
+    """
+
+    COUNTRIES = ["Germany", "France", "United Kingdom", "Spain", "Italy", "Switzerland"]
+
+    def __init__(self, planes=500, interval_seconds=5, seed=42):
+        self.interval_seconds = interval_seconds
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._df = pd.DataFrame({
+            'icao24': [f"{i:06x}" for i in range(planes)],
+            'callsign': [f"FAKE{i}" for i in range(planes)],
+            'origin_country': self._rng.choice(self.COUNTRIES, planes),
+            'longitude': self._rng.uniform(-10, 25, planes),
+            'latitude': self._rng.uniform(35, 60, planes),
+            'velocity': self._rng.uniform(150, 260, planes),
+            'true_track': self._rng.uniform(0, 360, planes)
+        })
+        self._ingest_time = None
+
+    def _advance(self, now):
+        df = self._df
+        seconds = self.interval_seconds
+        heading = np.radians(df['true_track'].to_numpy())
+        meters = df['velocity'].to_numpy() * seconds
+        df['latitude'] = df['latitude'] + meters * np.cos(heading) / 111320
+        df['longitude'] = df['longitude'] + meters * np.sin(heading) / (111320 * np.cos(np.radians(df['latitude'])))
+        df['true_track'] = (df['true_track'] + self._rng.normal(0, 3, len(df))) % 360
+        df['time_position'] = now
+        df['ingest_time'] = now
+        self._ingest_time = now
+
+    def __call__(self, country=None):
+        now = pd.Timestamp.now(tz='UTC').floor(f"{self.interval_seconds}s")
+        with self._lock:
+            if self._ingest_time != now:
+                self._advance(now)
+            df = self._df.copy()
+        return df[df['origin_country'] == country] if country else df
+
+
+def register_push_routes(server, broadcaster):
+    """Mount the /stream/planes Server-Sent Events endpoint on the Flask server."""
+
+    @server.route("/stream/planes")
+    def stream_planes():
+        channel = (request.args.get("country") or "ALL", "bin" if request.args.get("format") == "bin" else "json")
+        return Response(
+            broadcaster.stream(channel),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+
+if __name__ == "__main__":
+    # Local test server: python -m utils.push, then open
+    # http://localhost:8051/static/streaming_map.html?push=1 (add &format=bin for the binary feed)
+    import os
+    from flask import Flask
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = Flask(__name__, static_folder=os.path.join(root, "static"), static_url_path="/static")
+    broadcaster = SnapshotBroadcaster()
+    register_push_routes(server, broadcaster)
+    SnapshotPublisher(broadcaster, FakeSnapshotSource()).start()
+    server.run(port=8051, threaded=True)
@@ -0,0 +1,184 @@
+"""
+Historical replay of opensky_raw on the live map.
+
+ReplayService loads window_seconds of snapshots with one range query, splits
+the rows per snapshot timestamp in memory and turns them into one full
+snapshot followed by deltas (see utils.live_feed.diff_planes), so the map
+plays a whole window from a single request. Windows are aligned to
+window_seconds and kept in a small LRU cache; serving a window starts loading
+the next one in the background, so playback does not wait on the warehouse.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from flask import jsonify, request
+
+from utils.live_feed import diff_planes, drop_stale_planes, project_planes
+from utils.wire import encode_planes_base64
+
+
+def split_snapshots(df, filter_minutes=2):
+    """
+    Split the rows of several snapshots by ingest_time and return the replay
+    frames oldest first: a full snapshot followed by deltas against the
+    previous frame, with the planes as base64 utils.wire tables.
+    """
+    frames = []
+    if df is None or df.empty:
+        return frames
+    previous = None
+    previous_version = None
+    for ingest_time, snapshot in df.groupby('ingest_time', sort=True):
+        planes = project_planes(drop_stale_planes(snapshot, filter_minutes))
+        seconds = ingest_time.timestamp()
+        version = f"replay@{seconds:.0f}"
+        if previous is None:
+            changed, removed = planes, []
+            frame = {"mode": "full", "base_version": None}
+        else:
+            added, updated, removed = diff_planes(previous, planes)
+            changed = pd.concat([added, updated])
+            frame = {"mode": "delta", "base_version": previous_version}
+        frame.update({
+            "time": seconds,
+            "version": version,
+            "encoding": "bin",
+            "planes": encode_planes_base64(changed),
+            "removed": removed,
+            "count": len(planes)
+        })
+        frames.append(frame)
+        previous, previous_version = planes, version
+    return frames
+
+
+class ReplayService:
+    """
+    Replay windows of opensky_raw. fetch_range(start, end, country) returns
+    the rows of every snapshot with start <= timestamp < end (epoch seconds);
+    fetch_extent() returns the (first, last) snapshot time or None.
+    """
+
+    def __init__(self, fetch_range, fetch_extent, window_seconds=300, cache_windows=6, filter_minutes=2):
+        self.fetch_range = fetch_range
+        self.fetch_extent = fetch_extent
+        self.window_seconds = window_seconds
+        self.cache_windows = cache_windows
+        self.filter_minutes = filter_minutes
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()   # (start, country) -> window
+        self._loading = {}              # (start, country) -> {"done": Event, "window"} while loading
+        self.loads = 0
+        self.hits = 0
+
+    def extent(self):
+        """Return {"start", "end", "window_seconds"} of the replayable history, or None."""
+        extent = self.fetch_extent()
+        if extent is None:
+            return None
+        return {"start": extent[0], "end": extent[1], "window_seconds": self.window_seconds}
+
+    def _load(self, start, country):
+        end = start + self.window_seconds
+        df = self.fetch_range(start, end, country)
+        extent = self.fetch_extent()
+        window = {
+            "start": start,
+            "end": end,
+            "frames": split_snapshots(df, self.filter_minutes),
+            # Windows reaching past the newest snapshot can still grow and are not cached
+            "complete": extent is not None and end <= extent[1]
+        }
+        print(f"[Replay] Loaded {len(window['frames'])} snapshots from {start} to {end} ({len(df) if df is not None else 0} rows)")
+        return window
+
+    def window(self, seconds, country=None, prefetch=True):
+        """Return the window containing seconds; concurrent requests for it share one load."""
+        start = int(seconds // self.window_seconds * self.window_seconds)
+        key = (start, country)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                self._windows.move_to_end(key)
+                self.hits += 1
+            loading = self._loading.get(key) if window is None else None
+            owner = window is None and loading is None
+            if owner:
+                loading = self._loading[key] = {"done": threading.Event(), "window": None}
+
+        if loading is not None and not owner:
+            loading["done"].wait()
+            window = loading["window"]
+            if window is None:
+                raise RuntimeError(f"Loading the replay window at {start} failed")
+        elif owner:
+            try:
+                window = self._load(start, country)
+                loading["window"] = window
+                with self._lock:
+                    self.loads += 1
+                    if window["complete"]:
+                        self._windows[key] = window
+                        while len(self._windows) > self.cache_windows:
+                            self._windows.popitem(last=False)
+            finally:
+                with self._lock:
+                    del self._loading[key]
+                loading["done"].set()
+
+        if prefetch and window["complete"]:
+            self.prefetch(start + self.window_seconds, country)
+        return window
+
+    def prefetch(self, seconds, country=None):
+        """Load the window containing seconds in a background thread unless it is cached or loading."""
+        start = int(seconds // self.window_seconds * self.window_seconds)
+        with self._lock:
+            if (start, country) in self._windows or (start, country) in self._loading:
+                return
+
+        def load():
+            try:
+                self.window(start, country, prefetch=False)
+            except Exception as e:
+                print(f"[Replay] Prefetch of {start} failed: {str(e)}")
+
+        threading.Thread(target=load, daemon=True, name="replay-prefetch").start()
+
+    def stats(self):
+        with self._lock:
+            return {"windows": len(self._windows), "loading": len(self._loading), "loads": self.loads, "hits": self.hits}
+
+
+def register_replay_routes(server, service):
+    """
+    Mount /api/replay/extent and /api/replay/window?start=<epoch seconds>
+    (optionally &country=) on the Flask server.
+    """
+
+    @server.route("/api/replay/extent")
+    def replay_extent():
+        extent = service.extent()
+        if extent is None:
+            return jsonify({"error": "No history available"}), 503
+        return jsonify(extent)
+
+    @server.route("/api/replay/window")
+    def replay_window():
+        try:
+            start = float(request.args["start"])
+        except (KeyError, ValueError):
+            start = None
+        if start is None or not math.isfinite(start):
+            return jsonify({"error": "start must be epoch seconds"}), 400
+        try:
+            window = service.window(start, request.args.get("country") or None)
+        except Exception as e:
+            print(f"[Replay] Loading the window at {start} failed: {str(e)}")
+            return jsonify({"error": "History unavailable"}), 503
+        response = jsonify(window)
+        # Complete windows never change, so browsers may keep them
+        response.headers["Cache-Control"] = "public, max-age=3600" if window["complete"] else "no-cache"
+        return response
@@ -0,0 +1,209 @@
+"""
+Local Arrow IPC copies of cached tables for warm restarts.
+
+SnapshotStore writes the latest DataFrame of a cache key to one Arrow IPC
+file per key and reads it back through a memory map, so a restarted app can
+serve the previous snapshot at once while the first warehouse query runs.
+Every file carries the cache key, the warehouse source, a data version, a
+fingerprint of its column names and types and the store format in its schema
+metadata. Files from another format, another catalog/schema or whose columns
+no longer match the key are ignored; the fingerprint lets the caller compare
+a snapshot with the live table before serving it.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pyarrow
+import pyarrow.ipc
+
+# Bump when the layout of cached DataFrames changes in code
+SNAPSHOT_FORMAT = 2
+
+
+def _encode_key(key):
+    if isinstance(key, str):
+        return json.dumps(key)
+    table_name, columns, filters = key
+    return json.dumps([table_name, list(columns), [list(f) for f in filters]])
+
+
+def _decode_key(text):
+    value = json.loads(text)
+    if isinstance(value, str):
+        return value
+    table_name, columns, filters = value
+    return (table_name, tuple(columns), tuple(tuple(f) for f in filters))
+
+
+def _kind(arrow_type):
+    # Coarse enough to survive pandas conversions such as int columns with nulls becoming float
+    if pyarrow.types.is_null(arrow_type):
+        return None
+    if pyarrow.types.is_timestamp(arrow_type) or pyarrow.types.is_date(arrow_type):
+        return "time"
+    if pyarrow.types.is_integer(arrow_type) or pyarrow.types.is_floating(arrow_type) or pyarrow.types.is_decimal(arrow_type):
+        return "number"
+    if pyarrow.types.is_boolean(arrow_type):
+        return "boolean"
+    if pyarrow.types.is_string(arrow_type) or pyarrow.types.is_large_string(arrow_type):
+        return "string"
+    return str(arrow_type)
+
+
+def _schema_fingerprint(schema):
+    return [[field.name, _kind(field.type)] for field in schema]
+
+
+def fingerprint(df):
+    """[[column, kind]] of a DataFrame; kind is None where it cannot be told, e.g. empty object columns."""
+    return _schema_fingerprint(pyarrow.Schema.from_pandas(df, preserve_index=False))
+
+
+def fingerprints_match(stored, live):
+    """True if both have the same columns in the same order and no known kinds differ."""
+    if [name for name, _ in stored] != [name for name, _ in live]:
+        return False
+    return all(a is None or b is None or a == b for (_, a), (_, b) in zip(stored, live))
+
+
+class SnapshotStore:
+
+    def __init__(self, directory, source, max_age_seconds=86400, save_seconds=60):
+        self.directory = directory
+        self.source = source
+        self.max_age_seconds = max_age_seconds
+        self.save_seconds = save_seconds
+        self._lock = threading.Lock()
+        self._saved_at = {}    # key -> monotonic time of the last save
+        self._pending = {}     # key -> (df, version) waiting for the writer thread
+        self._writing = False
+        self._changed = threading.Condition(self._lock)
+        self._writer = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(_encode_key(key).encode("utf-8")).hexdigest()[:16]
+        table_name = key if isinstance(key, str) else key[0]
+        return os.path.join(self.directory, f"{table_name}-{digest}.arrow")
+
+    def save(self, key, df, version=None, force=False):
+        """
+        Write df as the latest snapshot of key, at most every save_seconds
+        unless force is set. Returns True if the file was written.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._saved_at.get(key, -self.save_seconds) < self.save_seconds:
+                return False
+            self._saved_at[key] = now
+        try:
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        except (pyarrow.ArrowException, TypeError, ValueError) as e:
+            print(f"[Snapshot] Cannot store {key}: {str(e)}")
+            return False
+
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({
+            b"snapshot.format": str(SNAPSHOT_FORMAT).encode(),
+            b"snapshot.source": self.source.encode(),
+            b"snapshot.key": _encode_key(key).encode(),
+            b"snapshot.version": str(version if version is not None else "").encode(),
+            b"snapshot.fingerprint": json.dumps(_schema_fingerprint(table.schema)).encode(),
+            b"snapshot.saved_at": str(time.time()).encode()
+        })
+        table = table.replace_schema_metadata(metadata)
+
+        path = self._path(key)
+        temporary = f"{path}.tmp"
+        try:
+            with pyarrow.OSFile(temporary, "wb") as sink:
+                with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"[Snapshot] Error writing {path}: {str(e)}")
+            return False
+        return True
+
+    def save_later(self, key, df, version=None):
+        """
+        Queue df to be saved by a background writer thread and return at once.
+        Only the newest queued frame of each key is written.
+        """
+        with self._lock:
+            self._pending[key] = (df, version)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_pending, daemon=True, name="snapshot-writer")
+                self._writer.start()
+            self._changed.notify_all()
+
+    def _write_pending(self):
+        while True:
+            with self._lock:
+                self._writing = False
+                self._changed.notify_all()
+                while not self._pending:
+                    self._changed.wait()
+                key = next(iter(self._pending))
+                df, version = self._pending.pop(key)
+                self._writing = True
+            try:
+                self.save(key, df, version)
+            except Exception as e:
+                print(f"[Snapshot] Cannot store {key}: {str(e)}")
+
+    def flush(self, timeout=None):
+        """Wait until every queued frame is written; False on timeout."""
+        with self._lock:
+            return self._changed.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _read(self, path):
+        """Return ((key, version, fingerprint, DataFrame), None) from path, or (None, reason) if it must not be used."""
+        with pyarrow.memory_map(path, "r") as source:
+            table = pyarrow.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata or {}
+        if metadata.get(b"snapshot.format") != str(SNAPSHOT_FORMAT).encode():
+            return None, "written by another format"
+        if metadata.get(b"snapshot.source") != self.source.encode():
+            return None, "from another source"
+        if time.time() - float(metadata.get(b"snapshot.saved_at", b"0")) > self.max_age_seconds:
+            return None, "too old"
+        key = _decode_key(metadata[b"snapshot.key"].decode())
+        if self._path(key) != path:
+            return None, "stored under another key"
+        if not isinstance(key, str) and key[1] and list(key[1]) != table.schema.names:
+            return None, "columns do not match its key"
+        version = metadata.get(b"snapshot.version", b"").decode()
+        stored_fingerprint = json.loads(metadata[b"snapshot.fingerprint"].decode())
+        return (key, version, stored_fingerprint, table.to_pandas(split_blocks=True)), None
+
+    def load_all(self):
+        """Return [(key, version, fingerprint, DataFrame)] for every usable stored snapshot; unusable files are removed."""
+        snapshots = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".arrow"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                snapshot, reason = self._read(path)
+            except (pyarrow.ArrowException, OSError, KeyError, ValueError) as e:
+                snapshot, reason = None, f"unreadable ({str(e)})"
+            if snapshot is None:
+                print(f"[Snapshot] Rejecting {name}: {reason}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            snapshots.append(snapshot)
+        return snapshots
+
+    def discard(self, key):
+        """Delete the stored snapshot of key, e.g. when its table changed."""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
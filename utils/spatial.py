@@ -0,0 +1,93 @@
+"""
+Viewport culling for the live map.
+
+GridIndex buckets one snapshot's positions into fixed lon/lat cells sorted
+by cell id, so the aircraft inside a bounding box are found with one binary
+search per row of cells instead of a scan of the whole snapshot.
+viewport_bounds turns the extent reported by the map into a padded, snapped
+bounding box, so small pans reuse the same box (and plane feed version).
+"""
+import math
+
+import numpy as np
+
+
+class GridIndex:
+    """Row positions of a snapshot bucketed into cell_degrees x cell_degrees cells."""
+
+    def __init__(self, longitudes, latitudes, cell_degrees=1.0):
+        self.cell_degrees = cell_degrees
+        self.cols = int(math.ceil(360 / cell_degrees))
+        self.rows = int(math.ceil(180 / cell_degrees))
+        self.lon = np.asarray(longitudes, dtype=float)
+        self.lat = np.asarray(latitudes, dtype=float)
+
+        valid = np.flatnonzero(np.isfinite(self.lon) & np.isfinite(self.lat))
+        keys = self._row(self.lat[valid]) * self.cols + self._col(self.lon[valid])
+        order = np.argsort(keys, kind='stable')
+        self.positions = valid[order]
+        self.keys = keys[order]
+
+    def _col(self, lon):
+        return np.clip(np.floor((np.asarray(lon) + 180) / self.cell_degrees), 0, self.cols - 1).astype(np.int64)
+
+    def _row(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell_degrees), 0, self.rows - 1).astype(np.int64)
+
+    def _query(self, min_lon, min_lat, max_lon, max_lat):
+        rows = np.arange(self._row(min_lat), self._row(max_lat) + 1)
+        starts = np.searchsorted(self.keys, rows * self.cols + self._col(min_lon), side='left')
+        ends = np.searchsorted(self.keys, rows * self.cols + self._col(max_lon), side='right')
+        if not len(rows) or not (ends > starts).any():
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate([self.positions[s:e] for s, e in zip(starts, ends) if e > s])
+        # Cells on the border are only partly inside the box
+        lon = self.lon[candidates]
+        lat = self.lat[candidates]
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        return candidates[inside]
+
+    def query(self, bounds):
+        """Sorted row positions inside bounds (min_lon, min_lat, max_lon, max_lat); max_lon may exceed 180."""
+        min_lon, min_lat, max_lon, max_lat = bounds
+        if max_lon > 180:
+            # The box crosses the antimeridian
+            positions = np.concatenate([
+                self._query(min_lon, min_lat, 180, max_lat),
+                self._query(-180, min_lat, max_lon - 360, max_lat)
+            ])
+        else:
+            positions = self._query(min_lon, min_lat, max_lon, max_lat)
+        return np.sort(positions)
+
+
+def viewport_bounds(viewport, padding=0.25):
+    """
+    Padded bounding box for a map viewport {"extent": [min_lon, min_lat,
+    max_lon, max_lat], "zoom": z}, snapped outwards to a grid a quarter of
+    its size. Returns None when there is no viewport or it covers the world.
+    """
+    if not viewport or not viewport.get("extent"):
+        return None
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in viewport["extent"])
+    width = max_lon - min_lon
+    height = max_lat - min_lat
+    if width <= 0 or height <= 0:
+        return None
+
+    min_lon -= width * padding
+    max_lon += width * padding
+    min_lat -= height * padding
+    max_lat += height * padding
+
+    step = 2.0 ** math.ceil(math.log2(max(width, height) / 4))
+    min_lon = math.floor(min_lon / step) * step
+    max_lon = math.ceil(max_lon / step) * step
+    min_lat = max(-90.0, math.floor(min_lat / step) * step)
+    max_lat = min(90.0, math.ceil(max_lat / step) * step)
+    if max_lon - min_lon >= 360:
+        return None
+
+    # Keep min_lon in [-180, 180); max_lon goes beyond 180 across the antimeridian
+    shift = math.floor((min_lon + 180) / 360) * 360
+    return (min_lon - shift, min_lat, max_lon - shift, max_lat)
@@ -0,0 +1,234 @@
+"""
+XYZ density tiles of aircraft positions.
+
+For each snapshot the positions are projected to Web Mercator once and
+sorted by the Morton (z-order) code of their density cell at the deepest
+zoom level. Every tile at every zoom then covers one contiguous slice of
+that order, so a tile's density grid is a binary search plus a bincount over
+the aircraft inside it. Grids are turned into PNG tiles only when requested
+and kept in an LRU cache keyed by snapshot version.
+"""
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from flask import Response, jsonify, request
+
+TILE_SIZE = 256
+# Density cells per tile side; each cell is TILE_SIZE / GRID_SIZE pixels
+GRID_BITS = 6
+GRID_SIZE = 1 << GRID_BITS
+MAX_LATITUDE = 85.05112878
+
+
+def _spread_bits(v):
+    """Insert a zero bit between each of the lower 32 bits of v."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def morton(x, y):
+    """Interleave the bits of cell coordinates x and y into z-order codes."""
+    return _spread_bits(np.asarray(x)) | (_spread_bits(np.asarray(y)) << np.uint64(1))
+
+
+def _color_ramp():
+    """RGBA colours for intensity 0..255; 0 stays transparent."""
+    stops = np.array([
+        [0, 0, 255, 0],
+        [0, 0, 255, 120],
+        [0, 255, 255, 160],
+        [0, 255, 0, 190],
+        [255, 255, 0, 215],
+        [255, 0, 0, 240]
+    ], dtype=float)
+    positions = np.linspace(0, 255, len(stops))
+    levels = np.arange(256)
+    ramp = np.stack([np.interp(levels, positions, stops[:, c]) for c in range(4)], axis=1)
+    ramp[0] = 0
+    return ramp.astype(np.uint8)
+
+
+COLOR_RAMP = _color_ramp()
+
+
+def encode_png(rgba):
+    """Encode an (h, w, 4) uint8 array as a PNG without an imaging library."""
+    height, width, _ = rgba.shape
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    # Every row starts with filter type 0 (none)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+class DensityPyramid:
+    """Density grids of one snapshot for every tile from zoom 0 to max_zoom."""
+
+    def __init__(self, longitudes, latitudes, max_zoom=12):
+        self.max_zoom = max_zoom
+        self.levels = max_zoom + GRID_BITS
+        lon = np.asarray(longitudes, dtype=float)
+        lat = np.asarray(latitudes, dtype=float)
+        valid = np.isfinite(lon) & np.isfinite(lat) & (np.abs(lon) <= 180)
+        lon = lon[valid]
+        lat = np.clip(lat[valid], -MAX_LATITUDE, MAX_LATITUDE)
+
+        # Web Mercator cell coordinates at the deepest level, y growing southwards
+        scale = float(1 << self.levels)
+        x = (lon + 180.0) / 360.0 * scale
+        lat_rad = np.radians(lat)
+        y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0 * scale
+        limit = (1 << self.levels) - 1
+        cx = np.clip(x, 0, limit).astype(np.uint64)
+        cy = np.clip(y, 0, limit).astype(np.uint64)
+
+        order = np.argsort(morton(cx, cy), kind="stable")
+        self.codes = morton(cx, cy)[order]
+        self.cx = cx[order]
+        self.cy = cy[order]
+        self._peaks = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _slice(self, z, x, y):
+        shift = np.uint64(2 * (self.levels - z))
+        first = morton(np.uint64(x), np.uint64(y)) << shift
+        last = (morton(np.uint64(x), np.uint64(y)) + np.uint64(1)) << shift
+        return slice(int(np.searchsorted(self.codes, first)), int(np.searchsorted(self.codes, last)))
+
+    def grid(self, z, x, y):
+        """Aircraft counts per density cell of tile z/x/y as a (GRID_SIZE, GRID_SIZE) array."""
+        rows = self._slice(z, x, y)
+        shift = np.uint64(self.levels - z - GRID_BITS)
+        mask = np.uint64(GRID_SIZE - 1)
+        gx = ((self.cx[rows] >> shift) & mask).astype(np.intp)
+        gy = ((self.cy[rows] >> shift) & mask).astype(np.intp)
+        counts = np.bincount(gy * GRID_SIZE + gx, minlength=GRID_SIZE * GRID_SIZE)
+        return counts.reshape(GRID_SIZE, GRID_SIZE)
+
+    def peak(self, z):
+        """Largest cell count at zoom z, so all tiles of a zoom share one colour scale."""
+        with self._lock:
+            if z not in self._peaks:
+                cells = self.codes >> np.uint64(2 * (self.levels - z - GRID_BITS))
+                if len(cells) == 0:
+                    self._peaks[z] = 0
+                else:
+                    # codes are sorted, so equal cells are adjacent
+                    starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1], True])
+                    self._peaks[z] = int(np.diff(starts).max())
+            return self._peaks[z]
+
+    def tile(self, z, x, y):
+        """PNG bytes of tile z/x/y."""
+        counts = self.grid(z, x, y)
+        peak = self.peak(z)
+        if peak == 0 or not counts.any():
+            return EMPTY_TILE
+        # Log scale, so single aircraft stay visible next to busy airports
+        levels = np.where(counts > 0, 1 + np.log1p(counts) / np.log1p(peak) * 254, 0).astype(np.uint8)
+        rgba = COLOR_RAMP[levels]
+        cell = TILE_SIZE // GRID_SIZE
+        rgba = np.repeat(np.repeat(rgba, cell, axis=0), cell, axis=1)
+        return encode_png(rgba)
+
+
+class DensityTileService:
+    """
+    Serves density tiles for the snapshot returned by source(). A new version
+    starts whenever source() returns a different DataFrame object with
+    positions; while it returns None or an empty frame (e.g. the warehouse is
+    failing) the previous pyramid is kept. Tiles are rendered on request and
+    cached per (version, z, x, y).
+    """
+
+    def __init__(self, source, max_zoom=12, cache_tiles=2048):
+        self.source = source
+        self.max_zoom = max_zoom
+        self.cache_tiles = cache_tiles
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+        self._pyramid = None
+        self._tiles = OrderedDict()   # (version, z, x, y) -> PNG bytes
+        self.hits = 0
+        self.misses = 0
+
+    def current(self):
+        """Return (version, pyramid) for the current snapshot."""
+        df = self.source()
+        usable = df is not None and not df.empty and 'longitude' in df.columns and 'latitude' in df.columns
+        with self._lock:
+            if self._pyramid is None and not usable:
+                self._pyramid = DensityPyramid([], [], self.max_zoom)
+            elif usable and df is not self._snapshot:
+                pyramid = DensityPyramid(df['longitude'].to_numpy(), df['latitude'].to_numpy(), self.max_zoom)
+                self._snapshot = df
+                self._version += 1
+                self._pyramid = pyramid
+                print(f"[Tiles] Density version {self._version} with {len(pyramid)} aircraft")
+            return self._version, self._pyramid
+
+    def tile(self, z, x, y):
+        """(version, PNG bytes) of tile z/x/y for the current snapshot, or None if out of range."""
+        if z < 0 or z > self.max_zoom or not (0 <= x < (1 << z)) or not (0 <= y < (1 << z)):
+            return None
+        version, pyramid = self.current()
+        key = (version, z, x, y)
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return version, data
+            self.misses += 1
+        data = pyramid.tile(z, x, y)
+        with self._lock:
+            self._tiles[key] = data
+            while len(self._tiles) > self.cache_tiles:
+                self._tiles.popitem(last=False)
+        return version, data
+
+    def stats(self):
+        with self._lock:
+            return {"version": self._version, "tiles": len(self._tiles), "hits": self.hits, "misses": self.misses}
+
+
+def register_tile_routes(server, service):
+    """Mount /tiles/density/<z>/<x>/<y>.png and /tiles/density/version on the Flask server."""
+
+    @server.route("/tiles/density/version")
+    def density_version():
+        version, pyramid = service.current()
+        return jsonify({"version": version, "aircraft": len(pyramid), "max_zoom": service.max_zoom})
+
+    @server.route("/tiles/density/<int:z>/<int:x>/<int:y>.png")
+    def density_tile(z, x, y):
+        result = service.tile(z, x, y)
+        if result is None:
+            return Response(status=404)
+        version, data = result
+        # Only a ?v= naming the version being served marks a fixed snapshot the browser may keep
+        cache = "public, max-age=300" if request.args.get("v") == str(version) else "no-cache"
+        return Response(data, mimetype="image/png", headers={"Cache-Control": cache})
@@ -0,0 +1,151 @@
+"""
+Recent positions per aircraft for flight trails on the live map.
+
+TrajectoryStore keeps the last `points` positions of up to `max_aircraft`
+aircraft in preallocated (max_aircraft, points) arrays used as ring buffers,
+so memory is fixed when the store is created (about 16 bytes per point) and
+feeding a snapshot is a handful of vectorized writes instead of DataFrame
+appends. Aircraft not seen for evict_seconds free their slot; when every
+slot is taken the least recently seen aircraft are replaced.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+from flask import jsonify, request
+
+
+class TrajectoryStore:
+
+    def __init__(self, points=32, max_aircraft=30000, evict_seconds=600):
+        self.points = points
+        self.max_aircraft = max_aircraft
+        self.evict_seconds = evict_seconds
+        self._lock = threading.Lock()
+        self._lon = np.full((max_aircraft, points), np.nan, dtype=np.float32)
+        self._lat = np.full((max_aircraft, points), np.nan, dtype=np.float32)
+        self._time = np.full((max_aircraft, points), np.nan, dtype=np.float64)   # epoch seconds
+        self._head = np.zeros(max_aircraft, dtype=np.int64)     # next write position per slot
+        self._count = np.zeros(max_aircraft, dtype=np.int64)    # stored positions per slot
+        self._last_seen = np.full(max_aircraft, -np.inf)        # time of the newest position per slot
+        self._slots = {}                                        # icao24 -> slot
+        self._free = list(range(max_aircraft - 1, -1, -1))
+        self._snapshot = None
+
+    def _release(self, slots):
+        # Called with the lock held
+        for slot in slots:
+            self._count[slot] = 0
+            self._head[slot] = 0
+            self._last_seen[slot] = -np.inf
+            self._free.append(int(slot))
+        if len(slots):
+            released = set(int(s) for s in slots)
+            self._slots = {icao24: slot for icao24, slot in self._slots.items() if slot not in released}
+
+    def _allocate(self, icao24s, keep):
+        # Called with the lock held; replaces the least recently seen aircraft when full
+        missing = len(icao24s) - len(self._free)
+        if missing > 0:
+            occupied = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+            occupied = occupied[~np.isin(occupied, keep)]
+            oldest = occupied[np.argsort(self._last_seen[occupied], kind='stable')[:missing]]
+            self._release(oldest)
+        for icao24 in icao24s[:len(self._free)]:
+            self._slots[icao24] = self._free.pop()
+
+    def ingest(self, df):
+        """Append the new positions in snapshot df; positions already stored are skipped."""
+        if df is None or df.empty or self._snapshot is df:
+            return
+        if not {'icao24', 'longitude', 'latitude', 'time_position'}.issubset(df.columns):
+            return
+        planes = df[['icao24', 'longitude', 'latitude', 'time_position']].dropna()
+        planes = planes.drop_duplicates('icao24', keep='last')
+        times = pd.to_datetime(planes['time_position'], utc=True, errors='coerce')
+        seconds = (times - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = np.isfinite(seconds)
+        icao24s = planes['icao24'].to_numpy()[valid]
+        lon = planes['longitude'].to_numpy(dtype=np.float32)[valid]
+        lat = planes['latitude'].to_numpy(dtype=np.float32)[valid]
+        seconds = seconds[valid]
+        if not len(seconds):
+            return
+
+        with self._lock:
+            self._snapshot = df
+            # Evict aircraft that have not reported for evict_seconds
+            occupied = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+            stale = occupied[self._last_seen[occupied] < seconds.max() - self.evict_seconds]
+            self._release(stale)
+
+            known = np.array([self._slots.get(icao24, -1) for icao24 in icao24s], dtype=np.int64)
+            new = np.flatnonzero(known < 0)
+            if len(new):
+                self._allocate(icao24s[new].tolist(), known[known >= 0])
+                known[new] = [self._slots.get(icao24, -1) for icao24 in icao24s[new]]
+
+            # Only positions newer than the last stored one are written
+            write = (known >= 0)
+            write[write] &= seconds[write] > self._last_seen[known[write]]
+            slots = known[write]
+            heads = self._head[slots]
+            self._lon[slots, heads] = lon[write]
+            self._lat[slots, heads] = lat[write]
+            self._time[slots, heads] = seconds[write]
+            self._head[slots] = (heads + 1) % self.points
+            self._count[slots] = np.minimum(self._count[slots] + 1, self.points)
+            self._last_seen[slots] = seconds[write]
+
+    def trails(self, icao24s, points=None):
+        """Return {icao24: [[longitude, latitude, epoch seconds], ...]} oldest first for the known aircraft."""
+        points = self.points if points is None else max(1, min(int(points), self.points))
+        result = {}
+        with self._lock:
+            for icao24 in icao24s:
+                slot = self._slots.get(icao24)
+                if slot is None or self._count[slot] == 0:
+                    continue
+                count = min(int(self._count[slot]), points)
+                order = (self._head[slot] - count + np.arange(count)) % self.points
+                result[icao24] = np.column_stack([
+                    self._lon[slot, order].astype(np.float64).round(5),
+                    self._lat[slot, order].astype(np.float64).round(5),
+                    self._time[slot, order]
+                ]).tolist()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "aircraft": len(self._slots),
+                "capacity": self.max_aircraft,
+                "points": self.points,
+                "bytes": self._lon.nbytes + self._lat.nbytes + self._time.nbytes
+            }
+
+
+def register_trail_routes(server, get_trails):
+    """
+    Mount /api/trails on the Flask server. Aircraft are passed as
+    ?icao24=a,b,c or as a JSON body {"icao24": [...]}; ?points= limits the
+    number of positions per trail.
+    """
+
+    @server.route("/api/trails", methods=["GET", "POST"])
+    def trails():
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            return jsonify({"error": "body must be a JSON object"}), 400
+        icao24s = body.get("icao24") or [v for v in request.args.get("icao24", "").split(",") if v]
+        if not isinstance(icao24s, list) or not all(isinstance(v, str) for v in icao24s):
+            return jsonify({"error": "icao24 must be a list of strings"}), 400
+        points = body.get("points") or request.args.get("points")
+        if points:
+            try:
+                points = int(points)
+            except (TypeError, ValueError):
+                return jsonify({"error": "points must be a positive integer"}), 400
+            if points < 1:
+                return jsonify({"error": "points must be a positive integer"}), 400
+        return jsonify(get_trails(icao24s[:5000], points or None))
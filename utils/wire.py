@@ -0,0 +1,116 @@
+"""
+Compact columnar binary encoding for plane tables sent to the live map.
+
+Layout (little-endian, every array aligned to its element size):
+
+    header      4s magic "PLN1", uint32 plane count n, uint32 string count m,
+                uint32 string bytes s
+    float32[n]  longitude, latitude, velocity, true_track (NaN when missing)
+    float64[n]  time_position in epoch seconds (NaN when missing)
+    uint32[n]   icao24, callsign, origin_country as string table indices
+                (0xFFFFFFFF when missing)
+    uint32[m+1] string offsets into the UTF-8 string bytes
+    uint8[s]    UTF-8 string bytes
+
+The browser decodes this with typed array views over the received buffer
+(decodePlanes in static/streaming_map.html), without parsing per-record JSON.
+"""
+import base64
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"PLN1"
+HEADER = struct.Struct("<4sIII")
+MISSING = np.uint32(0xFFFFFFFF)
+
+FLOAT_COLUMNS = ['longitude', 'latitude', 'velocity', 'true_track']
+STRING_COLUMNS = ['icao24', 'callsign', 'origin_country']
+
+
+def _float_column(planes, column, dtype):
+    if column not in planes.columns:
+        return np.full(len(planes), np.nan, dtype=dtype)
+    return pd.to_numeric(planes[column], errors='coerce').to_numpy(dtype=dtype, na_value=np.nan)
+
+
+def _epoch_seconds(planes):
+    if 'time_position' not in planes.columns:
+        return np.full(len(planes), np.nan)
+    times = pd.to_datetime(planes['time_position'], utc=True, errors='coerce')
+    return (times - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def encode_planes(planes):
+    """Encode a projected plane table (index or column icao24) to bytes."""
+    if planes.index.name == 'icao24':
+        planes = planes.reset_index()
+    n = len(planes)
+
+    # One shared string table; repeated values such as countries are stored once
+    strings = {}
+    indices = []
+    for column in STRING_COLUMNS:
+        values = planes[column] if column in planes.columns else pd.Series([None] * n)
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        table_index = np.empty(len(uniques), dtype=np.uint32)
+        for i, value in enumerate(uniques):
+            table_index[i] = strings.setdefault(str(value), len(strings))
+        column_index = np.full(n, MISSING, dtype=np.uint32)
+        present = codes >= 0
+        column_index[present] = table_index[codes[present]]
+        indices.append(column_index)
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    string_bytes = b"".join(encoded)
+
+    parts = [HEADER.pack(MAGIC, n, len(encoded), len(string_bytes))]
+    parts += [_float_column(planes, column, np.float32).tobytes() for column in FLOAT_COLUMNS]
+    if (HEADER.size + 4 * len(FLOAT_COLUMNS) * n) % 8:
+        parts.append(b"\0" * 4)   # align the float64 block
+    parts.append(_epoch_seconds(planes).astype('<f8').tobytes())
+    parts += [column_index.astype('<u4').tobytes() for column_index in indices]
+    parts.append(offsets.astype('<u4').tobytes())
+    parts.append(string_bytes)
+    return b"".join(parts)
+
+
+def encode_planes_base64(planes):
+    """encode_planes for text transports such as Server-Sent Events or dcc.Store."""
+    return base64.b64encode(encode_planes(planes)).decode("ascii")
+
+
+def decode_planes(data):
+    """Decode bytes from encode_planes back into a DataFrame (used for testing and benchmarks)."""
+    magic, n, m, s = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a plane table")
+    offset = HEADER.size
+    columns = {}
+    for column in FLOAT_COLUMNS:
+        columns[column] = np.frombuffer(data, dtype='<f4', count=n, offset=offset)
+        offset += 4 * n
+    offset += offset % 8
+    seconds = np.frombuffer(data, dtype='<f8', count=n, offset=offset)
+    offset += 8 * n
+    indices = []
+    for _ in STRING_COLUMNS:
+        indices.append(np.frombuffer(data, dtype='<u4', count=n, offset=offset))
+        offset += 4 * n
+    offsets = np.frombuffer(data, dtype='<u4', count=m + 1, offset=offset)
+    offset += 4 * (m + 1)
+    string_bytes = data[offset:offset + s]
+    strings = np.array([string_bytes[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(m)] + [None], dtype=object)
+
+    df = pd.DataFrame({
+        column: strings[np.where(index == MISSING, m, index)]
+        for column, index in zip(STRING_COLUMNS, indices)
+    })
+    for column in FLOAT_COLUMNS:
+        df[column] = columns[column]
+    df['time_position'] = pd.to_datetime(seconds, unit='s', utc=True)
+    return df